@@ -0,0 +1,14 @@
+'''
+CPU8Bit: an 8 bit CPU emulator, its assembler and tools.
+
+    from cpu8bit.assembler import assemble
+    from cpu8bit.cpu import CPU8Bit
+
+    cpu = CPU8Bit()
+    cpu.load_program(assemble("programs/fibonacci.asm"))
+    cpu.run_blocks()
+
+Nothing is imported here, so `cpu8` and worker processes only load the
+modules they use. The command line tools are subcommands of `cpu8`, see
+cli.py.
+'''
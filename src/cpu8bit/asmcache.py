@@ -0,0 +1,119 @@
+'''
+Content-addressed on-disk cache for assemble() output.
+
+Entries are keyed by a hash of the assembler version and the source text,
+so an edited source or a new assembler never hits a stale entry. Each entry
+is one small binary file:
+
+    magic "C8AC" | u16 format | u32 image length | zlib image
+    | u32 label count | (u16 name length, utf-8 name, u32 position) * count
+
+Files are written to a temporary name and renamed into place, so several
+worker processes can share a cache directory: a reader sees either a whole
+entry or none.
+'''
+
+import hashlib
+import os
+import struct
+import zlib
+
+from .assembler import ASSEMBLER_VERSION, assemble_segments, build_image
+
+MAGIC = b"C8AC"
+FORMAT_VERSION = 1
+
+
+def default_cache_dir() -> str:
+    return os.environ.get("CPU8_ASM_CACHE") or os.path.join(os.path.expanduser("~"), ".cache", "cpu8", "asm")
+
+
+def cache_key(source: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"cpu8-asm-{ASSEMBLER_VERSION}\n".encode())
+    digest.update(source)
+    return digest.hexdigest()
+
+
+def encode_entry(machine_code: bytes, labels: dict[str, int]) -> bytes:
+    image = zlib.compress(bytes(machine_code))
+    out = [MAGIC, struct.pack("<HI", FORMAT_VERSION, len(image)), image, struct.pack("<I", len(labels))]
+    for name, pos in labels.items():
+        encoded = name.encode("utf-8")
+        out.append(struct.pack("<H", len(encoded)))
+        out.append(encoded)
+        out.append(struct.pack("<I", pos))
+    return b"".join(out)
+
+
+def decode_entry(data: bytes) -> tuple[bytearray, dict[str, int]]:
+    if data[:4] != MAGIC:
+        raise ValueError("Not an assembly cache entry")
+    version, image_len = struct.unpack_from("<HI", data, 4)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported assembly cache format {version}")
+    pos = 10
+    machine_code = bytearray(zlib.decompress(data[pos:pos + image_len]))
+    pos += image_len
+
+    (count,) = struct.unpack_from("<I", data, pos)
+    pos += 4
+    labels = {}
+    for _ in range(count):
+        (name_len,) = struct.unpack_from("<H", data, pos)
+        pos += 2
+        name = data[pos:pos + name_len].decode("utf-8")
+        pos += name_len
+        (labels[name],) = struct.unpack_from("<I", data, pos)
+        pos += 4
+    return machine_code, labels
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    #tempfile is slow to import and only needed when writing
+    import tempfile
+
+    #a bare file name has no directory part, it goes in the current one
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        #mkstemp creates 0600 files, entries are meant to be shared
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def cached_assemble(file_name: str, cache_dir: str | None = None) -> tuple[bytearray, dict[str, int]]:
+    #returns (machine_code, labels), assembling only when the cache has no entry
+    cache_dir = cache_dir or default_cache_dir()
+    with open(file_name, "rb") as f:
+        source = f.read()
+    path = os.path.join(cache_dir, cache_key(source) + ".c8a")
+
+    try:
+        with open(path, "rb") as f:
+            return decode_entry(f.read())
+    except FileNotFoundError:
+        pass
+    except (ValueError, struct.error, zlib.error, UnicodeDecodeError):
+        #damaged entry, rebuild it below
+        pass
+
+    #assemble the text that was hashed, not whatever the file holds by now
+    segments, label_table = assemble_segments(source.decode("utf-8").splitlines())
+    machine_code = build_image(segments)
+    labels = dict(label_table.items())
+    try:
+        write_atomic(path, encode_entry(machine_code, labels))
+    except OSError:
+        #a read-only or full cache directory only costs the speedup
+        pass
+    return machine_code, labels
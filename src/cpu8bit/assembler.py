@@ -0,0 +1,319 @@
+from collections.abc import Iterable
+
+from .isa import IMM, MEM, MNEMONICS, REG, REG2, REG_PAIR
+from .peephole import optimize_lines
+
+#bump when the emitted code for a given source can change, invalidates cached assemblies
+ASSEMBLER_VERSION = 3
+
+class HashTable:
+    def __init__(self, size: int) -> None:
+        self.table = [None] * size
+        self.size = size
+        self.count = 0
+
+    def label_hash(self, input: str) -> int:
+        hashVal = 2166136261
+        for char in input:
+            hashVal ^= ord(char)
+            hashVal *= 16777619
+            hashVal &= 0xFFFFFFFF
+        return hashVal
+
+    def hash_function(self, input: str) -> int:
+        return self.label_hash(input) % self.size
+    
+    def add(self, label: str, pos: int) -> None:
+        #keep the load factor at or below 1/2 so probe chains stay short
+        if (self.count + 1) * 2 > self.size:
+            self.resize(self.size * 2)
+
+        hashVal = self.label_hash(label)
+        index = start = hashVal % self.size
+        while self.table[index] is not None:
+            if self.table[index][0] == label:
+                raise ValueError(f"Duplicate label: {label}")
+            index += 1
+            index %= self.size
+            if index == start:
+                raise MemoryError(f"Hash table has run out of locations. Size: {self.size}")
+        self.table[index] = [label, pos, hashVal]
+        self.count += 1
+
+    def resize(self, size: int) -> None:
+        #entries keep their full hash, so growing does not rehash the labels
+        entries = [entry for entry in self.table if entry is not None]
+        self.table = [None] * size
+        self.size = size
+        for entry in entries:
+            index = entry[2] % size
+            while self.table[index] is not None:
+                index = (index + 1) % size
+            self.table[index] = entry
+
+    def lookup(self, label: str) -> int:
+        index = start = self.hash_function(label)
+        while True:
+            if self.table[index] is None:
+                raise NameError(f"Label not in hash table. Label: {label}")
+            if self.table[index][0] == label:
+                return self.table[index][1]
+            index += 1
+            index %= self.size
+            if index == start:
+                raise NameError(f"Label not in hash table. Label: {label}")
+
+    def items(self) -> list[tuple[str, int]]:
+        return [(entry[0], entry[1]) for entry in self.table if entry is not None]
+
+def assemble(file_name: str, optimize: bool = False, report: list | None = None) -> bytearray:
+    machine_code, labels = assemble_program(file_name, optimize, report)
+    return machine_code
+
+def assemble_program(file_name: str, optimize: bool = False, report: list | None = None) -> tuple[bytearray, HashTable]:
+    with open(file_name, "r", encoding="utf-8") as f:
+        segments, labels = assemble_segments(f, optimize, report)
+    return build_image(segments), labels
+
+def build_image(segments: list[tuple[int, bytes]], size: int = 65536) -> bytearray:
+    #full memory image, later segments overwrite earlier ones like a second .org would
+    machine_code = bytearray(size)
+    for origin, data in segments:
+        machine_code[origin:origin + len(data)] = data
+    return machine_code
+
+def assemble_segments(source: str | Iterable[str], optimize: bool = False, report: list | None = None) -> tuple[list[tuple[int, bytes]], HashTable]:
+    #source is the program text, or any iterable of lines (open file, stdin, generator)
+    #returns the emitted (origin, bytes) segments in source order, one per .org run
+    #optimize runs the peephole pass first, which needs the whole source, and
+    #appends (line number, before, after) for every rewrite to report
+    if isinstance(source, str):
+        source = source.splitlines()
+
+    assembler = Assembler()
+    if not optimize:
+        for raw_line in source:
+            assembler.handle_raw_line(raw_line)
+        return assembler.finish()
+
+    lines = []
+    for number, raw_line in enumerate(source, 1):
+        parts = tokenize(raw_line)
+        if parts:
+            lines.append((number, raw_line, parts))
+    for number, raw_line, parts in optimize_lines(lines, report):
+        assembler.line_number = number
+        assembler.raw_line = raw_line
+        assembler.handle_mnemonic(parts)
+    return assembler.finish()
+
+def tokenize(raw_line: str) -> list[str]:
+    #mnemonic and operand tokens of a source line, empty for blank / comment lines
+    line = raw_line.rstrip("\r\n")
+    line = line.split(";", 1)[0].strip()
+    line = line.replace(",", " ")
+    return line.split()
+
+class Assembler:
+    #all state lives on the instance, so separate assemblies can run on separate threads
+    def __init__(self) -> None:
+        self.mem_pos = 0
+        self.line_number = 0
+        self.raw_line = ""
+        self.segments = []
+        self.current = None
+
+        #labels are added as they are defined, references to labels that are not
+        #defined yet are patched in once the whole source has been read
+        self.labels = HashTable(16)
+        self.fixups = []
+
+    def segment(self) -> bytearray:
+        #the segment being written, a new one starts at the first byte after an .org
+        if self.current is None:
+            self.current = bytearray()
+            self.segments.append((self.mem_pos, self.current))
+        return self.current
+
+    def emit(self, data: list[int]) -> None:
+        self.segment().extend(data)
+        self.mem_pos += len(data)
+        if self.mem_pos >= 65536:
+            raise OverflowError(f"Assembly error. Memory overflow error. mem_pos: {self.mem_pos}")
+
+    def parse_reg(self, parts: list[str], idx: int) -> int:
+        reg_tok = parts[idx].rstrip(",").upper() 
+        if not reg_tok.startswith("R") or not reg_tok[1:].isdigit():
+            raise ValueError(f"Bad register: {parts[idx]!r} on line {self.line_number}")
+
+        reg = int(reg_tok[1:])
+        if reg < 0 or reg > 3:
+            raise ValueError(f"Register out of range: R{reg} on line {self.line_number}")
+        
+        return reg
+    
+    def parse_imm(self, parts: list[str], idx: int) -> int:
+        imm_tok = parts[idx]
+        if imm_tok.startswith("#"):
+            imm_tok = imm_tok[1:]
+
+        try:
+            imm = int(imm_tok, 0) & 0xFF
+        except ValueError:
+            raise ValueError(f"Bad immediate {parts[idx]!r} on line {self.line_number}")
+        
+        return imm
+    
+    def parse_addr(self, parts: list[str], idx: int, brackets: bool, offset: int) -> tuple[int, int]:
+        #offset is where the low address byte goes, relative to mem_pos
+        addr_tok = parts[idx].strip()
+
+        if brackets:
+            if not (addr_tok.startswith("[") and addr_tok.endswith("]")):
+                raise ValueError(f"Address must be in [brackets]: {parts[idx]!r} on line {self.line_number}")
+
+            addr_str = addr_tok[1:-1].strip()
+
+        else:
+            if (addr_tok.startswith("[") and addr_tok.endswith("]")):
+                raise ValueError(f"Address should not be in [brackets]: {parts[idx]!r} on line {self.line_number}")
+            addr_str = addr_tok
+
+        try:
+            addr = int(addr_str, 0)
+        except ValueError:
+            try:
+                addr_str = addr_str.replace(" ", "")
+                label, modifier = addr_str, 0
+                if "+" in addr_str:
+                    label, off = addr_str.split("+", 1)
+                    modifier = int(off, 0)
+            except ValueError:
+                raise ValueError(f"Bad address offset {addr_str!r} on line {self.line_number}")
+            try:
+                addr = self.labels.lookup(label) + modifier
+            except NameError:
+                #forward reference, patched after the pass
+                data = self.segment()
+                self.fixups.append((data, len(data) + offset, label, modifier, addr_str, self.line_number))
+                return 0, 0
+
+        if not (0 <= addr <= 0xFFFF):
+            raise ValueError(f"Address out of range {addr:#x} on line {self.line_number}")
+
+        lo = addr & 0xFF
+        hi = (addr >> 8) & 0xFF
+
+        return lo, hi
+
+    def parse_reg_reg(self, parts: list[str], idx: int) -> tuple[int, int]:
+        reg_tok = parts[idx].rstrip(",").upper()
+
+        if reg_tok.startswith("[") and reg_tok.endswith("]"):
+            reg_tok = reg_tok[1:-1].strip()
+
+        if ":" not in reg_tok:
+            raise ValueError(f"Expected register pair like [R1:R2], got {parts[idx]} on line {self.line_number}")
+        
+        reg_tok_hi, reg_tok_lo = reg_tok.split(":", 1)
+        if not reg_tok_hi.startswith("R") or not reg_tok_hi[1:].isdigit():
+            raise ValueError(f"Bad register: {parts[idx]!r} on line {self.line_number}")
+        if not reg_tok_lo.startswith("R") or not reg_tok_lo[1:].isdigit():
+            raise ValueError(f"Bad register: {parts[idx]!r} on line {self.line_number}")
+        
+        regHi = int(reg_tok_hi[1:])
+        regLo = int(reg_tok_lo[1:])
+        if regHi < 0 or regHi > 3 or regLo < 0 or regLo > 3:
+            raise ValueError(f"Register out of range on line {self.line_number}")
+        
+        return regHi, regLo
+
+    def handle_directive(self, mnemonic: str, parts: list[str]) -> None:
+        if mnemonic == ".ORG":
+            mem_pos = int(parts[1], 0)
+            if not (0 <= mem_pos <= 0xFFFF):
+                raise ValueError(f".org value error. Line: {self.line_number}")
+            self.mem_pos = mem_pos
+            self.current = None
+
+        elif mnemonic == ".BYTE":
+            self.emit([int(part.strip(","), 0) for part in parts[1:]])
+
+        elif mnemonic == ".WORD":
+            self.emit(self.parse_addr(parts, 1, False, 0))
+
+    def handle_mnemonic(self, parts: list[str]) -> None:
+        mnemonic = parts[0].upper()
+
+        forms = MNEMONICS.get(mnemonic)
+        if forms is None:
+            if mnemonic.endswith(":"): #label
+                self.labels.add(parts[0][:-1], self.mem_pos)
+            elif mnemonic.startswith("."): #directives
+                self.handle_directive(mnemonic, parts)
+            else:
+                raise ValueError(f"Unknown mnemonic: {mnemonic} on line {self.line_number}")
+            return
+
+        instruction = forms[0]
+        if len(parts) <= len(instruction.operands):
+            raise ValueError(f"Bad {mnemonic} syntax: {self.raw_line!r} on line {self.line_number}")
+
+        if len(forms) > 1:
+            #forms differ in an IMM / REG2 operand, a register token picks the REG2 form
+            idx = instruction.choice[0][0]
+            kind = REG2 if parts[idx].upper().startswith("R") else IMM
+            for form in forms:
+                if form.choice[0][1] == kind:
+                    instruction = form
+                    break
+
+        #encode from the operand kinds in the table
+        data = [instruction.opcode]
+        for idx, kind in instruction.operand_slots:
+            if kind == REG:
+                data[0] += self.parse_reg(parts, idx)
+            elif kind == IMM:
+                data.append(self.parse_imm(parts, idx))
+            elif kind == REG2:
+                data.append(self.parse_reg(parts, idx))
+            elif kind == REG_PAIR:
+                regHi, regLo = self.parse_reg_reg(parts, idx)
+                data.append((regHi << 4) + regLo)
+            else: #MEM / ADDR
+                data.extend(self.parse_addr(parts, idx, kind == MEM, len(data)))
+
+        #one slice write per instruction
+        self.emit(data)
+
+    def handle_raw_line(self, raw_line: str) -> None:
+        self.line_number += 1
+        self.raw_line = raw_line
+
+        parts = tokenize(raw_line)
+        if parts:
+            self.handle_mnemonic(parts)
+
+    def finish(self) -> tuple[list[tuple[int, bytes]], HashTable]:
+        #patch forward references now that every label is known
+        for data, pos, label, modifier, addr_str, line in self.fixups:
+            try:
+                addr = self.labels.lookup(label) + modifier
+            except NameError:
+                raise ValueError(f"Unknown label {addr_str!r} on line {line}")
+            if not (0 <= addr <= 0xFFFF):
+                raise ValueError(f"Address out of range {addr:#x} on line {line}")
+            data[pos] = addr & 0xFF
+            data[pos + 1] = (addr >> 8) & 0xFF
+
+        return [(origin, bytes(data)) for origin, data in self.segments if data], self.labels
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    #the program given, or programs/program.asm of the source checkout
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "programs", "program.asm")
+    machine_code = assemble(path)
+    for b in range(0, 100):
+        print(f"0x{machine_code[b]:02X}")
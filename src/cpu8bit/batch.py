@@ -0,0 +1,290 @@
+'''
+Lockstep batch engine: N CPU8Bit machines run side by side, sharing one
+program image but each with its own registers, flags, PC and memory.
+
+State lives in NumPy arrays (reg is (N, 4), mem is (N, 65536)) and every
+step executes one instruction on every running lane, grouped by the kind
+of instruction each lane is currently on. Results match CPU8Bit lane for
+lane, including the error messages of invalid opcodes and registers.
+
+NumPy is an optional dependency (pip install cpu8bit[batch]); nothing else
+in the package imports this module, so the other tools run without it.
+'''
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("The batch engine needs NumPy: pip install cpu8bit[batch]") from e
+
+from .isa import FAMILIES, FETCH_LENGTH, OPCODES
+
+
+#instruction kinds
+NOP, HLT, JMP, JZ, JNZ, LDI, LD, ST, ADD_IMM, ADD_REG, SUB_IMM, AND_IMM, OR_IMM, XOR_IMM, MOV, LDX, STX, BAD_OPCODE, BAD_REG = range(19)
+
+#ISA table names -> kinds
+NAME_KINDS = {
+    "nop": NOP,
+    "hlt": HLT,
+    "jmp": JMP,
+    "jz": JZ,
+    "jnz": JNZ,
+    "ldi": LDI,
+    "ld": LD,
+    "st": ST,
+    "add_imm": ADD_IMM,
+    "add_reg": ADD_REG,
+    "sub_imm": SUB_IMM,
+    "and_imm": AND_IMM,
+    "or_imm": OR_IMM,
+    "xor_imm": XOR_IMM,
+    "mov_reg": MOV,
+    "ldx_regs": LDX,
+    "stx_regs": STX,
+}
+
+
+def build_tables():
+    #per opcode: fetch length and kind, from the ISA table
+    length = np.array(FETCH_LENGTH, dtype=np.int32)
+    kind = np.zeros(256, dtype=np.int32)
+    for opcode in range(256):
+        instruction = OPCODES[opcode]
+        if instruction is not None:
+            kind[opcode] = NAME_KINDS[instruction.name]
+        elif opcode & 0xF0 in FAMILIES:
+            kind[opcode] = BAD_REG
+        else:
+            kind[opcode] = BAD_OPCODE
+    return length, kind
+
+LENGTH, KIND = build_tables()
+
+
+class BatchCPU:
+    def __init__(self, n):
+        self.n = n
+
+        #8 bit registers, one row per lane
+        self.reg = np.zeros((n, 4), dtype=np.uint8)
+        self.IR = np.zeros(n, dtype=np.uint8)
+
+        #1 bit flags
+        self.Z = np.zeros(n, dtype=np.uint8)
+        self.C = np.zeros(n, dtype=np.uint8)
+
+        #16 bit registers
+        self.PC = np.zeros(n, dtype=np.int32)
+        self.MAR = np.zeros(n, dtype=np.int32)
+
+        self.mem = np.zeros((n, 65536), dtype=np.uint8)
+        self.halted = np.zeros(n, dtype=bool)
+
+        #instructions executed per lane, and the error message of lanes that failed
+        self.cycles = np.zeros(n, dtype=np.int64)
+        self.errors = {}
+
+        self.handlers = {
+            NOP: self.op_nop,
+            HLT: self.op_hlt,
+            JMP: self.op_jmp,
+            JZ: self.op_jz,
+            JNZ: self.op_jnz,
+            LDI: self.op_ldi,
+            LD: self.op_ld,
+            ST: self.op_st,
+            ADD_IMM: self.op_add_imm,
+            ADD_REG: self.op_add_reg,
+            SUB_IMM: self.op_sub_imm,
+            AND_IMM: self.op_and_imm,
+            OR_IMM: self.op_or_imm,
+            XOR_IMM: self.op_xor_imm,
+            MOV: self.op_mov_reg,
+            LDX: self.op_ldx_regs,
+            STX: self.op_stx_regs,
+            BAD_OPCODE: self.op_bad_opcode,
+            BAD_REG: self.op_bad_reg,
+        }
+
+    def load_program(self, program, start=0):
+        #the same image is copied into every lane
+        program = np.frombuffer(bytes(program), dtype=np.uint8)
+        if start + len(program) > self.mem.shape[1]:
+            raise IndexError(f"Program does not fit in memory at {start:04X}")
+        self.mem[:, start:start + len(program)] = program
+
+    def lane_state(self, i):
+        return {
+            "reg": [int(v) for v in self.reg[i]],
+            "IR": int(self.IR[i]),
+            "Z": int(self.Z[i]),
+            "C": int(self.C[i]),
+            "PC": int(self.PC[i]),
+            "MAR": int(self.MAR[i]),
+            "halted": bool(self.halted[i]),
+            "error": self.errors.get(i),
+        }
+
+    '''
+    Start of instructions
+
+    Every handler gets the lane indices it applies to, the register id from
+    the low nibble of the opcode, the operand byte and the 16 bit address
+    operand, each as an array with one entry per lane.
+    '''
+
+    def set_z(self, rows, values):
+        self.Z[rows] = values == 0
+
+    def fail(self, rows, messages):
+        self.halted[rows] = True
+        for lane, message in zip(rows.tolist(), messages):
+            self.errors[lane] = message
+
+    def op_nop(self, rows, r, operand, addr):
+        pass
+
+    def op_hlt(self, rows, r, operand, addr):
+        self.halted[rows] = True
+
+    def op_jmp(self, rows, r, operand, addr):
+        self.PC[rows] = addr
+
+    def op_jz(self, rows, r, operand, addr):
+        taken = self.Z[rows] != 0
+        self.PC[rows[taken]] = addr[taken]
+
+    def op_jnz(self, rows, r, operand, addr):
+        taken = self.Z[rows] == 0
+        self.PC[rows[taken]] = addr[taken]
+
+    def op_ldi(self, rows, r, operand, addr):
+        self.reg[rows, r] = operand
+        self.set_z(rows, operand)
+
+    def op_ld(self, rows, r, operand, addr):
+        values = self.mem[rows, addr]
+        self.reg[rows, r] = values
+        self.set_z(rows, values)
+
+    def op_st(self, rows, r, operand, addr):
+        self.mem[rows, addr] = self.reg[rows, r]
+
+    def add(self, rows, r, values):
+        result = self.reg[rows, r].astype(np.int32) + values
+        self.reg[rows, r] = result & 0xFF
+        self.C[rows] = result > 255
+        self.set_z(rows, result & 0xFF)
+
+    def op_add_imm(self, rows, r, operand, addr):
+        self.add(rows, r, operand)
+
+    def op_add_reg(self, rows, r, operand, addr):
+        r2 = operand & 0x0F
+        bad = r2 > 3
+        if bad.any():
+            self.fail(rows[bad], [f"Invalid register2 {v:02X}" for v in operand[bad].tolist()])
+            rows, r, r2 = rows[~bad], r[~bad], r2[~bad]
+        self.add(rows, r, self.reg[rows, r2])
+
+    def op_sub_imm(self, rows, r, operand, addr):
+        result = self.reg[rows, r].astype(np.int32) - operand
+        self.reg[rows, r] = result & 0xFF
+        #C = 1 means no borrow, as in set_c_flag_sub
+        self.C[rows] = result >= 0
+        self.set_z(rows, result & 0xFF)
+
+    def op_and_imm(self, rows, r, operand, addr):
+        values = self.reg[rows, r] & operand
+        self.reg[rows, r] = values
+        self.set_z(rows, values)
+
+    def op_or_imm(self, rows, r, operand, addr):
+        values = self.reg[rows, r] | operand
+        self.reg[rows, r] = values
+        self.set_z(rows, values)
+
+    def op_xor_imm(self, rows, r, operand, addr):
+        values = self.reg[rows, r] ^ operand
+        self.reg[rows, r] = values
+        self.set_z(rows, values)
+
+    def op_mov_reg(self, rows, r, operand, addr):
+        r1 = operand & 0x0F
+        bad = r1 > 3
+        if bad.any():
+            self.fail(rows[bad], [f"Invalid register in operand {v:02X}" for v in operand[bad].tolist()])
+            rows, r, r1 = rows[~bad], r[~bad], r1[~bad]
+        values = self.reg[rows, r1]
+        self.reg[rows, r] = values
+        self.set_z(rows, values)
+
+    def reg_pair(self, rows, r, operand):
+        #split the [R1:R2] operand, failing lanes with a register id above 3
+        r1 = (operand >> 4) & 0x0F
+        r2 = operand & 0x0F
+        bad = (r1 > 3) | (r2 > 3)
+        if bad.any():
+            self.fail(rows[bad], [f"Invalid register in operand {v:02X}" for v in operand[bad].tolist()])
+            rows, r, r1, r2 = rows[~bad], r[~bad], r1[~bad], r2[~bad]
+        addr = (self.reg[rows, r1].astype(np.int32) << 8) + self.reg[rows, r2]
+        return rows, r, addr
+
+    def op_ldx_regs(self, rows, r, operand, addr):
+        rows, r, addr = self.reg_pair(rows, r, operand)
+        values = self.mem[rows, addr]
+        self.reg[rows, r] = values
+        self.set_z(rows, values)
+
+    def op_stx_regs(self, rows, r, operand, addr):
+        rows, r, addr = self.reg_pair(rows, r, operand)
+        self.mem[rows, addr] = self.reg[rows, r]
+
+    def op_bad_opcode(self, rows, r, operand, addr):
+        self.fail(rows, [f"Unknown opcode {v:02X}" for v in self.IR[rows].tolist()])
+
+    def op_bad_reg(self, rows, r, operand, addr):
+        self.fail(rows, [f"Invalid register in opcode {v:02X}" for v in self.IR[rows].tolist()])
+
+    '''
+    End of instructions
+    '''
+
+    def step(self):
+        #one instruction on every running lane, returns the number of lanes stepped
+        lanes = np.flatnonzero(~self.halted)
+        if lanes.size == 0:
+            return 0
+
+        #fetch opcode, operand and address, then advance PC and MAR
+        mem = self.mem
+        pc = self.PC[lanes]
+        opcode = mem[lanes, pc]
+        operand = mem[lanes, (pc + 1) & 0xFFFF]
+        addr = (mem[lanes, (pc + 2) & 0xFFFF].astype(np.int32) << 8) | operand
+
+        self.IR[lanes] = opcode
+        self.PC[lanes] = (pc + LENGTH[opcode]) & 0xFFFF
+        long = LENGTH[opcode] == 3
+        self.MAR[lanes[long]] = addr[long]
+        self.cycles[lanes] += 1
+
+        #execute, one vectorised handler call per kind present
+        kinds = KIND[opcode]
+        r = opcode & 0x0F
+        for kind in np.unique(kinds).tolist():
+            sel = kinds == kind
+            self.handlers[kind](lanes[sel], r[sel], operand[sel], addr[sel])
+        return lanes.size
+
+    def run(self, max_cycles=100000):
+        #returns a mask of the lanes still running after max_cycles instructions,
+        #those are the lanes where CPU8Bit.run would raise "Max cpu cycles exceeded"
+        start = self.cycles.copy()
+        for _ in range(max_cycles):
+            if not self.step():
+                break
+        exceeded = (self.cycles - start) >= max_cycles
+        for lane in np.flatnonzero(exceeded).tolist():
+            self.errors.setdefault(lane, "Max cpu cycles exceeded")
+        return exceeded
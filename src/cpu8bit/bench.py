@@ -0,0 +1,221 @@
+'''
+Benchmarks for the emulator and the assembler.
+
+Emulator workloads are the .asm programs in a directory, by default the
+programs/ of the source checkout (an installed package has none, pass
+--programs), plus a few generated long-running ones, each run through CPU8Bit.run and CPU8Bit.run_blocks and
+reported as emulated instructions per second. The assembler is timed on
+generated sources of 1K, 100K and 1M lines and reported as lines per second.
+
+Results are JSON. Given a baseline file from an earlier run, every rate that
+dropped by more than the threshold is reported as a regression and the exit
+status is 1.
+
+    cpu8 bench --output bench.json
+    cpu8 bench --baseline bench.json --threshold 0.10
+    cpu8 bench --programs path/to/programs
+'''
+
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from .assembler import assemble, assemble_segments
+from .cpu import CPU8Bit
+
+
+#programs/ of the source checkout, not part of an installed package
+PROGRAMS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "programs")
+
+ENGINES = ("run", "run_blocks")
+
+#generated emulator workloads, long enough to time a single run
+GENERATED_PROGRAMS = {
+    #nested counted loops over register arithmetic
+    "gen_nested_loops": """
+        LDI R0, #0
+    outer:
+        LDI R1, #0
+    inner:
+        ADD R2, R1
+        XOR R3, #0x5A
+        ADD R3, #7
+        SUB R1, #1
+        JNZ inner
+        SUB R0, #1
+        JNZ outer
+        HLT
+    """,
+    #direct and register-indirect memory traffic
+    "gen_memory": """
+        LDI R0, #0
+        LDI R1, #0x20
+    loop:
+        LDI R2, #0
+    fill:
+        STX R2, [R1:R2]
+        LDX R3, [R1:R2]
+        ST R3, [0x1000]
+        LD R3, [0x1000]
+        ADD R2, #1
+        JNZ fill
+        SUB R0, #1
+        JNZ loop
+        HLT
+    """,
+}
+
+
+def load_workloads(programs_dir=None):
+    #the .asm files of programs_dir, or of PROGRAMS_DIR when there is one,
+    #and the generated programs
+    if programs_dir is None and os.path.isdir(PROGRAMS_DIR):
+        programs_dir = PROGRAMS_DIR
+    workloads = {}
+    for name in sorted(os.listdir(programs_dir)) if programs_dir else ():
+        if name.endswith(".asm"):
+            with open(os.path.join(programs_dir, name), "r", encoding="utf-8") as f:
+                workloads[name] = assemble_segments(f)[0]
+    for name, source in GENERATED_PROGRAMS.items():
+        workloads[name] = assemble_segments(source)[0]
+    return workloads
+
+
+def bench_emulator(segments, engine, min_time):
+    #runs the program from the same snapshot until min_time has passed
+    cpu = CPU8Bit()
+    cpu.load_segments(segments)
+    start = cpu.snapshot()
+    run = getattr(cpu, engine)
+
+    instructions = 0
+    runs = 0
+    t0 = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        cpu.restore(start)
+        instructions += run(max_cycles=100_000_000)
+        runs += 1
+        elapsed = time.perf_counter() - t0
+    return {"rate": instructions / elapsed, "unit": "instructions/s", "instructions": instructions, "runs": runs, "seconds": elapsed}
+
+
+def generate_source(lines):
+    #straight-line code with labels and forward jumps, restarting at .org 0
+    #every few thousand lines so any length fits the 64 KB address space
+    out = []
+    for i in range(lines):
+        if i % 4096 == 1:
+            out.append(".org 0x0000")
+        elif i % 8 == 0:
+            out.append(f"L{i}:")
+        elif i % 8 == 7:
+            out.append(f"    JNZ L{i + 1} ; forward reference")
+        else:
+            r = i % 4
+            kind = i % 5
+            if kind == 0:
+                out.append(f"    LDI R{r}, #{i & 0xFF}")
+            elif kind == 1:
+                out.append(f"    ADD R{r}, R{(r + 1) % 4}")
+            elif kind == 2:
+                out.append(f"    ST R{r}, [0x{0x8000 + (i & 0xFFF):04X}]")
+            elif kind == 3:
+                out.append(f"    LDX R{r}, [R1:R2]")
+            else:
+                out.append(f"    SUB R{r}, #1")
+    out.append(f"L{lines}:")
+    return "\n".join(out) + "\n"
+
+
+def bench_assembler(lines, min_time):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"gen_{lines}.asm")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(generate_source(lines))
+
+        runs = 0
+        t0 = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time or runs == 0:
+            assemble(path)
+            runs += 1
+            elapsed = time.perf_counter() - t0
+    return {"rate": lines * runs / elapsed, "unit": "lines/s", "lines": lines, "runs": runs, "seconds": elapsed}
+
+
+def run_benchmarks(min_time=0.5, asm_sizes=(1_000, 100_000, 1_000_000), engines=ENGINES, log=None, programs_dir=None):
+    results = {}
+    for name, segments in load_workloads(programs_dir).items():
+        for engine in engines:
+            key = f"emulator/{engine}/{name}"
+            results[key] = bench_emulator(segments, engine, min_time)
+            if log:
+                log(f"{key}: {results[key]['rate']:,.0f} {results[key]['unit']}")
+    for lines in asm_sizes:
+        key = f"assembler/{lines}_lines"
+        results[key] = bench_assembler(lines, min_time)
+        if log:
+            log(f"{key}: {results[key]['rate']:,.0f} {results[key]['unit']}")
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(report, baseline, threshold):
+    #rates are higher-is-better, returns (key, baseline rate, rate, change) for regressions
+    regressions = []
+    for key, result in report["results"].items():
+        old = baseline.get("results", {}).get(key)
+        if old is None or not old.get("rate"):
+            continue
+        change = result["rate"] / old["rate"] - 1.0
+        if change < -threshold:
+            regressions.append((key, old["rate"], result["rate"], change))
+    return regressions
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CPU8Bit emulator and assembler benchmarks")
+    parser.add_argument("--output", "-o", help="write the JSON report to this file (default: stdout)")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown against the baseline, as a fraction (default: 0.10)")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend on each benchmark (default: 0.5)")
+    parser.add_argument("--engine", action="append", choices=ENGINES, help="emulator engines to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="skip the 1M line assembler benchmark")
+    parser.add_argument("--programs", help="directory of .asm workloads (default: programs/ of the source checkout, if any)")
+    args = parser.parse_args(argv)
+
+    sizes = (1_000, 100_000) if args.quick else (1_000, 100_000, 1_000_000)
+    report = run_benchmarks(args.min_time, sizes, args.engine or ENGINES, log=lambda line: print(line, file=sys.stderr), programs_dir=args.programs)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for key, old, new, change in regressions:
+            print(f"REGRESSION {key}: {old:,.0f} -> {new:,.0f} ({change:+.1%})", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+'''
+Basic block compiler for CPU8Bit.
+
+A block is the run of instructions starting at some PC and ending at the
+first JMP / JZ / JNZ / HLT. Each block is turned into Python source once,
+compiled, and then executes the whole run in a single call, with the
+registers held in locals and the flags only computed where they can be seen.
+
+A block that is a whole counted loop (see compile_loop) also gets a loop
+function that runs all of its remaining iterations in one call, in closed
+form where the body allows it.
+'''
+
+import math
+
+MAX_BLOCK_LEN = 64
+
+#must match PAGE_SIZE in cpu.py, stores mark their page dirty for snapshots
+PAGE_SIZE = 256
+
+#instructions that end a block (they are included in it)
+BLOCK_ENDS = ("op_jmp", "op_jz", "op_jnz", "op_hlt")
+
+Z_WRITERS = frozenset((
+    "op_ldi", "op_ld", "op_add_imm", "op_add_reg", "op_sub_imm", "op_and_imm",
+    "op_or_imm", "op_xor_imm", "op_mov_reg", "op_ldx_regs",
+))
+
+C_WRITERS = frozenset(("op_add_imm", "op_add_reg", "op_sub_imm"))
+
+
+#instructions a fast-forwarded loop body may contain, registers and immediates only
+LOOP_OPS = frozenset((
+    "op_nop", "op_ldi", "op_add_imm", "op_add_reg", "op_sub_imm", "op_and_imm",
+    "op_or_imm", "op_xor_imm", "op_mov_reg",
+))
+
+
+class Block:
+    def __init__(self, fn, start, size, count, source, loop=None, pcs=(), branch=None):
+        self.fn = fn            #fn(cpu, reg, mem, code_addrs) -> instructions executed
+        self.start = start      #address of the first instruction
+        self.size = size        #bytes covered, from start
+        self.count = count      #instructions executed on a full run
+        self.source = source
+        self.pcs = pcs          #address of each instruction, in order
+        self.branch = branch    #(PC, taken when Z) of a closing JZ / JNZ, or None
+
+        #loop(cpu, reg, budget) -> instructions executed, runs every remaining
+        #iteration of a block that jumps back to itself, 0 if it cannot
+        self.loop = loop
+
+    def covers(self, addr):
+        return ((addr - self.start) & 0xFFFF) < self.size
+
+
+def decode_block(cpu, pc, stops=()):
+    #list of decode cache entries making up the block starting at pc, ending
+    #before any address in stops other than pc
+    entries = []
+    addr = pc
+    while len(entries) < MAX_BLOCK_LEN:
+        if entries and addr in stops:
+            break
+        entry = cpu.decode_cache.get(addr)
+        if entry is None:
+            entry = cpu.decode(addr)
+        name = entry[0].__name__
+        if name == "op_error":
+            #leave invalid instructions to step() so the error is raised there
+            break
+        entries.append(entry)
+        if name in BLOCK_ENDS:
+            break
+        addr = entry[2]
+    return entries
+
+
+def compile_block(cpu, pc, stops=()):
+    entries = decode_block(cpu, pc, stops)
+    if not entries:
+        return None
+
+    names = [entry[0].__name__ for entry in entries]
+
+    #a flag write is only materialised if something can observe it before
+    #the next write: a store that may leave the block early, or the block end
+    z_live = [False] * len(entries)
+    c_live = [False] * len(entries)
+    z_seen = c_seen = True
+    for i in range(len(entries) - 1, -1, -1):
+        name = names[i]
+        if name in ("op_st", "op_stx_regs"):
+            z_seen = c_seen = True
+        elif name in ("op_jz", "op_jnz"):
+            z_seen = True
+        if name in Z_WRITERS:
+            z_live[i] = z_seen
+            z_seen = False
+        if name in C_WRITERS:
+            c_live[i] = c_seen
+            c_seen = False
+
+    lines = ["    r0, r1, r2, r3 = reg"]
+    if "op_st" in names or "op_stx_regs" in names:
+        lines.append("    dirty = cpu.dirty_pages")
+    written = set()
+    z_local = c_local = False
+    mar = None
+    count = 0
+    end = None
+
+    def exit_lines(indent, next_pc, opcode):
+        #state write-back shared by the block end and early exits
+        out = [f"{indent}reg[{r}] = r{r}" for r in sorted(written)]
+        if z_local:
+            out.append(f"{indent}cpu.z_result = Z")
+        if c_local:
+            out.append(f"{indent}cpu.c_result = C")
+        if mar is not None:
+            out.append(f"{indent}cpu.MAR = {mar}")
+        out.append(f"{indent}cpu.IR = {opcode}")
+        if next_pc is not None:
+            out.append(f"{indent}cpu.PC = {next_pc}")
+        return out
+
+    for i, entry in enumerate(entries):
+        handler, opcode, next_pc, entry_mar, x, y, z = entry
+        name = names[i]
+        count += 1
+        if entry_mar is not None:
+            mar = entry_mar
+
+        if name == "op_nop":
+            pass
+        elif name == "op_ldi":
+            lines.append(f"    r{x} = {y}")
+            written.add(x)
+        elif name == "op_ld":
+            lines.append(f"    r{x} = mem[{y}]")
+            written.add(x)
+        elif name == "op_add_imm":
+            lines.append(f"    t = r{x} + {y}")
+            lines.append(f"    r{x} = t & 0xFF")
+            written.add(x)
+        elif name == "op_add_reg":
+            lines.append(f"    t = r{x} + r{y}")
+            lines.append(f"    r{x} = t & 0xFF")
+            written.add(x)
+        elif name == "op_sub_imm":
+            lines.append(f"    t = r{x} + {0x100 - y}")
+            lines.append(f"    r{x} = t & 0xFF")
+            written.add(x)
+        elif name == "op_and_imm":
+            lines.append(f"    r{x} &= {y}")
+            written.add(x)
+        elif name == "op_or_imm":
+            lines.append(f"    r{x} |= {y}")
+            written.add(x)
+        elif name == "op_xor_imm":
+            lines.append(f"    r{x} ^= {y}")
+            written.add(x)
+        elif name == "op_mov_reg":
+            lines.append(f"    r{x} = r{y}")
+            written.add(x)
+        elif name == "op_ldx_regs":
+            lines.append(f"    r{x} = mem[(r{y} << 8) + r{z}]")
+            written.add(x)
+        elif name in ("op_st", "op_stx_regs"):
+            if name == "op_st":
+                addr = str(y)
+                page = str(y // PAGE_SIZE)
+            else:
+                lines.append(f"    a = (r{y} << 8) + r{z}")
+                addr = "a"
+                page = f"a // {PAGE_SIZE}"
+            lines.append(f"    mem[{addr}] = r{x}")
+            lines.append(f"    dirty.add({page})")
+            #a store into cached code invalidates it, leave before running stale code
+            lines.append(f"    if {addr} in code_addrs:")
+            lines.extend(exit_lines("        ", next_pc, opcode))
+            lines.append(f"        cpu.invalidate_code({addr})")
+            lines.append(f"        return {count}")
+        else:
+            end = (name, opcode, next_pc, x)
+
+        #Z and C are kept as CPU8Bit.z_result / c_result, see there
+        if name in Z_WRITERS and z_live[i]:
+            lines.append(f"    Z = {y}" if name == "op_ldi" else f"    Z = r{x}")
+            z_local = True
+        if name in C_WRITERS and c_live[i]:
+            lines.append("    C = t")
+            c_local = True
+
+    last_opcode = entries[-1][1]
+    last_next_pc = entries[-1][2]
+    if end is None:
+        #ran into the length limit or an invalid instruction
+        lines.extend(exit_lines("    ", last_next_pc, last_opcode))
+    else:
+        name, opcode, next_pc, target = end
+        z = "Z" if z_local else "cpu.z_result"
+        lines.extend(exit_lines("    ", None, opcode))
+        if name == "op_jmp":
+            lines.append(f"    cpu.PC = {target}")
+        elif name == "op_jz":
+            lines.append(f"    cpu.PC = {next_pc} if {z} else {target}")
+        elif name == "op_jnz":
+            lines.append(f"    cpu.PC = {target} if {z} else {next_pc}")
+        else:
+            lines.append(f"    cpu.PC = {next_pc}")
+            lines.append("    cpu.halted = True")
+    lines.append(f"    return {count}")
+
+    source = f"def block_{pc:04X}(cpu, reg, mem, code_addrs):\n" + "\n".join(lines) + "\n"
+    namespace = {}
+    exec(compile(source, f"<block {pc:04X}>", "exec"), namespace)
+    fn = namespace[f"block_{pc:04X}"]
+
+    size = (last_next_pc - pc) & 0xFFFF or 0x10000
+    pcs = (pc,) + tuple(entry[2] for entry in entries[:-1])
+    branch = (pcs[-1], names[-1] == "op_jz") if names[-1] in ("op_jz", "op_jnz") else None
+    return Block(fn, pc, size, count, source, compile_loop(pc, entries, names), pcs, branch)
+
+
+def loop_iterations(step):
+    #times SUB counter, #step runs before the counter hits 0, for every
+    #starting counter value, None where it never does
+    g = math.gcd(step, 256)
+    period = 256 // g
+    inverse = pow(step // g, -1, period) if period > 1 else 0
+    return tuple(None if c % g else ((c // g) * inverse % period or period) for c in range(256))
+
+
+def compile_loop(pc, entries, names):
+    #a counted loop is a block ending in JNZ back to its own start, whose body
+    #only touches registers and whose last flag write is SUB counter, #imm, with
+    #nothing else writing the counter. Z is then 1 and C is 1 when it exits, and
+    #the number of iterations follows from the counter value on entry.
+    if names[-1] != "op_jnz" or entries[-1][3] != pc:
+        return None
+    body = entries[:-1]
+    body_names = names[:-1]
+    if any(name not in LOOP_OPS for name in body_names):
+        return None
+
+    last = None
+    for i, name in enumerate(body_names):
+        if name in Z_WRITERS:
+            last = i
+    if last is None or body_names[last] != "op_sub_imm":
+        return None
+    counter, step = body[last][4], body[last][5]
+    for i, name in enumerate(body_names):
+        if i != last and name != "op_nop" and body[i][4] == counter:
+            return None
+
+    written = {entry[4] for entry, name in zip(body, body_names) if name != "op_nop"}
+
+    #registers that only ever get a constant or an unchanging register added
+    #have a closed form, anything else is run as a tight loop over the body
+    deltas = {}
+    for entry, name in zip(body, body_names):
+        r = entry[4]
+        if name == "op_nop" or r == counter:
+            continue
+        if name == "op_add_imm":
+            deltas.setdefault(r, []).append(str(entry[5]))
+        elif name == "op_sub_imm":
+            deltas.setdefault(r, []).append(str(-entry[5]))
+        elif name == "op_add_reg" and entry[5] not in written:
+            deltas.setdefault(r, []).append(f"r{entry[5]}")
+        else:
+            deltas = None
+            break
+
+    count = len(entries)
+    lines = [
+        "    r0, r1, r2, r3 = reg",
+        f"    k = ITERATIONS[r{counter}]",
+        f"    if k is None or k * {count} > budget:",
+        "        return 0",
+    ]
+    if deltas is not None:
+        for r, terms in sorted(deltas.items()):
+            lines.append(f"    reg[{r}] = (r{r} + k * ({' + '.join(terms)})) & 0xFF")
+    else:
+        lines.append("    for _ in range(k):")
+        for entry, name in zip(body, body_names):
+            r, y = entry[4], entry[5]
+            if name == "op_ldi":
+                lines.append(f"        r{r} = {y}")
+            elif name == "op_add_imm":
+                lines.append(f"        r{r} = (r{r} + {y}) & 0xFF")
+            elif name == "op_add_reg":
+                lines.append(f"        r{r} = (r{r} + r{y}) & 0xFF")
+            elif name == "op_sub_imm":
+                lines.append(f"        r{r} = (r{r} - {y}) & 0xFF")
+            elif name == "op_and_imm":
+                lines.append(f"        r{r} &= {y}")
+            elif name == "op_or_imm":
+                lines.append(f"        r{r} |= {y}")
+            elif name == "op_xor_imm":
+                lines.append(f"        r{r} ^= {y}")
+            elif name == "op_mov_reg":
+                lines.append(f"        r{r} = r{y}")
+        lines.extend(f"    reg[{r}] = r{r}" for r in sorted(written - {counter}))
+
+    handler, opcode, next_pc, target, x, y, z = entries[-1]
+    lines.extend([
+        f"    reg[{counter}] = 0",
+        "    cpu.z_result = 0",
+        "    cpu.c_result = 0x100",
+        f"    cpu.MAR = {target}",
+        f"    cpu.IR = {opcode}",
+        f"    cpu.PC = {next_pc}",
+        f"    return k * {count}",
+    ])
+
+    source = f"def loop_{pc:04X}(cpu, reg, budget):\n" + "\n".join(lines) + "\n"
+    namespace = {"ITERATIONS": loop_iterations(step)}
+    exec(compile(source, f"<loop {pc:04X}>", "exec"), namespace)
+    return namespace[f"loop_{pc:04X}"]
+
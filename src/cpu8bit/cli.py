@@ -0,0 +1,140 @@
+'''
+Command line entry point for the CPU8Bit tools.
+
+    cpu8 asm programs/fibonacci.asm -o fib.c8o --optimize
+    cpu8 run fib.c8o --max-cycles 1000000
+    cpu8 dump fib.c8o
+    cpu8 bench --quick
+
+Each subcommand imports only the modules it needs, when it runs, and no
+module in cpu8bit does any work at import time, so starting a tool or a worker
+process costs little more than the interpreter itself.
+'''
+
+import sys
+
+#name -> (module, function, help), the module is imported when the command
+#runs, None is this one
+COMMANDS = {
+    "asm": ("objfile", "main", "assemble a program into a .c8o object file"),
+    "run": (None, "run_main", "run a .asm or .c8o program and print its final state"),
+    "dump": (None, "dump_main", "print the segments and labels of a .asm or .c8o program"),
+    "bench": ("bench", "main", "emulator and assembler benchmarks"),
+    "jobs": ("runner", "main", "run jobs across a process pool"),
+    "profile": ("profiler", "main", "profile a program"),
+    "trace": ("tracer", "main", "print a trace file"),
+    "timeline": ("timeline", "main", "show the state at chosen cycles of a run"),
+    "fuzz": ("fuzz", "main", "coverage guided fuzzing of a program"),
+    "difftest": ("difftest", "main", "check every engine against the reference interpreter on random programs"),
+}
+
+
+def load(path):
+    #(segments, labels, entry) of a .c8o object file or .asm source
+    if path.endswith(".c8o"):
+        from .objfile import load_object
+
+        obj = load_object(path)
+        return obj.segments, obj.labels, obj.entry
+
+    from .assembler import assemble_segments
+
+    with open(path, "r", encoding="utf-8") as f:
+        segments, labels = assemble_segments(f)
+    return segments, dict(labels.items()), 0
+
+
+def parse_dump(text):
+    #"start:length"
+    start, _, length = text.partition(":")
+    return int(start, 0), int(length, 0) if length else 16
+
+
+def run_main(argv=None):
+    import argparse
+
+    from .cpu import CPU8Bit
+
+    parser = argparse.ArgumentParser(prog="cpu8 run", description="Run a CPU8Bit program")
+    parser.add_argument("program", help=".asm or .c8o program")
+    parser.add_argument("--max-cycles", type=int, default=100000)
+    parser.add_argument("--engine", choices=("run", "run_blocks"), default="run_blocks")
+    parser.add_argument("--dump", type=parse_dump, action="append", default=[], help="memory range start:length to print after the run")
+    args = parser.parse_args(argv)
+
+    segments, labels, entry = load(args.program)
+    cpu = CPU8Bit()
+    cpu.load_segments(segments)
+    cpu.PC = entry
+
+    status = 0
+    try:
+        cycles = getattr(cpu, args.engine)(args.max_cycles)
+        print(f"{cycles} cycles")
+    except (ValueError, IndexError) as e:
+        print(f"stopped: {e}", file=sys.stderr)
+        status = 1
+
+    regs = " ".join(f"R{i}={value:02X}" for i, value in enumerate(cpu.reg))
+    print(f"PC={cpu.PC:04X} IR={cpu.IR:02X} MAR={cpu.MAR:04X} {regs} Z={cpu.Z} C={cpu.C}{' HALT' if cpu.halted else ''}")
+    for start, length in args.dump:
+        print(hex_lines(start, cpu.view(start, start + length)))
+    return status
+
+
+def hex_lines(start, data, width=16):
+    lines = []
+    for offset in range(0, len(data), width):
+        row = bytes(data[offset:offset + width])
+        lines.append(f"{start + offset:04X}: {row.hex(' ').upper()}")
+    return "\n".join(lines)
+
+
+def dump_main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="cpu8 dump", description="Print the segments and labels of a CPU8Bit program")
+    parser.add_argument("program", help=".asm or .c8o program")
+    args = parser.parse_args(argv)
+
+    segments, labels, entry = load(args.program)
+    print(f"entry {entry:04X}")
+    for origin, data in segments:
+        print(f"segment {origin:04X}, {len(data)} bytes")
+        print(hex_lines(origin, data))
+    if labels:
+        print("labels")
+        for name, pos in sorted(labels.items(), key=lambda item: item[1]):
+            print(f"  {pos:04X} {name}")
+    return 0
+
+
+def usage():
+    lines = ["usage: cpu8 <command> [args]", "", "commands:"]
+    for name, (_, _, text) in COMMANDS.items():
+        lines.append(f"  {name:<10} {text}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0 if argv else 2
+
+    command = COMMANDS.get(argv[0])
+    if command is None:
+        print(f"cpu8: unknown command {argv[0]!r}\n\n{usage()}", file=sys.stderr)
+        return 2
+
+    module, function, _ = command
+    if module is None:
+        return globals()[function](argv[1:])
+
+    from importlib import import_module
+
+    return getattr(import_module("." + module, __package__), function)(argv[1:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+'''
+Execution coverage bitmaps for CPU8Bit.
+
+Coverage.run is another copy of the CPU8Bit.run_blocks loop, used through
+cpu.run(max_cycles, coverage=coverage). It sets one bit per executed PC and
+one per JZ / JNZ outcome, taken or not taken, so a whole run fits in 24 KB:
+
+    coverage = Coverage()
+    cpu.run(max_cycles, coverage=coverage)
+    pcs, edges = coverage.count()
+    new_bits = total.merge(coverage)
+
+Compiled blocks do the work, the bits of a block's instructions are only set
+the first time the block runs in full, and after that each run adds just its
+branch outcome. Loops are not fast-forwarded, so every iteration is seen.
+'''
+
+from .blocks import compile_block
+
+#bits per PC bitmap and per edge bitmap, edge bit = PC * 2 + taken
+PC_BITS = 0x10000
+EDGE_BITS = 0x20000
+
+BRANCHES = ("op_jz", "op_jnz")
+
+
+class Coverage:
+    def __init__(self):
+        self.pcs = bytearray(PC_BITS // 8)
+        self.edges = bytearray(EDGE_BITS // 8)
+
+        #indexes of the non-zero bytes of each, merge only looks at those
+        self.pc_bytes = set()
+        self.edge_bytes = set()
+
+        #blocks whose instructions are all set in pcs already
+        self.marked = set()
+
+        #PC of the instruction that raised in the last run, if one did
+        self.error_pc = None
+
+    @classmethod
+    def from_bytes(cls, data):
+        #the inverse of to_bytes, e.g. for coverage sent between processes
+        coverage = cls()
+        size = len(coverage.pcs)
+        coverage.pcs[:] = data[:size]
+        coverage.edges[:] = data[size:]
+        coverage.pc_bytes = {i for i, byte in enumerate(coverage.pcs) if byte}
+        coverage.edge_bytes = {i for i, byte in enumerate(coverage.edges) if byte}
+        return coverage
+
+    def to_bytes(self):
+        return bytes(self.pcs) + bytes(self.edges)
+
+    def count(self):
+        #(PCs executed, branch edges seen)
+        return (
+            int.from_bytes(self.pcs, "little").bit_count(),
+            int.from_bytes(self.edges, "little").bit_count(),
+        )
+
+    def covered(self):
+        #executed PCs in address order
+        pcs = self.pcs
+        return [pc for pc in range(PC_BITS) if pcs[pc >> 3] >> (pc & 7) & 1]
+
+    def merge(self, other):
+        #adds other's bits to these, returns how many were new
+        new = 0
+        for mine, mine_bytes, theirs, their_bytes in (
+            (self.pcs, self.pc_bytes, other.pcs, other.pc_bytes),
+            (self.edges, self.edge_bytes, other.edges, other.edge_bytes),
+        ):
+            for i in their_bytes:
+                added = theirs[i] & ~mine[i]
+                if added:
+                    new += added.bit_count()
+                    mine[i] |= added
+                    mine_bytes.add(i)
+        return new
+
+    def run(self, cpu, max_cycles=100000):
+        #CPU8Bit.run, same results and errors
+        cycles = self.advance(cpu, max_cycles)
+        if cycles >= max_cycles:
+            raise ValueError("Max cpu cycles exceeded")
+        return cycles
+
+    def advance(self, cpu, max_cycles):
+        pcs = self.pcs
+        edges = self.edges
+        marked = self.marked
+        pc_bytes = self.pc_bytes
+        edge_bytes = self.edge_bytes
+        blocks = cpu.block_cache if len(cpu.mem) >= 0x10000 else None
+        self.error_pc = None
+
+        cycles = 0
+        while not cpu.halted and cycles < max_cycles:
+            pc = cpu.PC & 0xFFFF
+            block = None
+            if blocks is not None:
+                block = blocks.get(pc)
+                if block is None:
+                    block = compile_block(cpu, pc)
+                    if block is not None:
+                        blocks[pc] = block
+
+            if block is None or cycles + block.count > max_cycles:
+                #invalid instruction, not enough budget left or small memory
+                pcs[pc >> 3] |= 1 << (pc & 7)
+                pc_bytes.add(pc >> 3)
+                try:
+                    entry = cpu.decode_cache.get(pc)
+                    if entry is None:
+                        entry = cpu.decode(pc)
+                    cpu.step()
+                except (ValueError, IndexError):
+                    self.error_pc = pc
+                    raise
+                cycles += 1
+                name = entry[0].__name__
+                if name in BRANCHES:
+                    #taken from the flag, a jump to the next PC is still taken
+                    edge = pc << 1 | ((cpu.z_result == 0) == (name == "op_jz"))
+                    edges[edge >> 3] |= 1 << (edge & 7)
+                    edge_bytes.add(edge >> 3)
+                continue
+
+            executed = block.fn(cpu, cpu.reg, cpu.mem, cpu.code_addrs)
+            cycles += executed
+            if executed == block.count:
+                if block not in marked:
+                    for addr in block.pcs:
+                        pcs[addr >> 3] |= 1 << (addr & 7)
+                        pc_bytes.add(addr >> 3)
+                    marked.add(block)
+                if block.branch is not None:
+                    branch_pc, on_zero = block.branch
+                    edge = branch_pc << 1 | ((cpu.z_result == 0) == on_zero)
+                    edges[edge >> 3] |= 1 << (edge & 7)
+                    edge_bytes.add(edge >> 3)
+            else:
+                #left early after a store into cached code
+                for addr in block.pcs[:executed]:
+                    pcs[addr >> 3] |= 1 << (addr & 7)
+                    pc_bytes.add(addr >> 3)
+        return cycles
@@ -0,0 +1,1089 @@
+from .blocks import compile_block
+from .isa import ADDR, FETCH_LENGTH, IMM, MEM, OPCODES, REG, REG2, opcode_error
+
+
+#memory is tracked for snapshots in pages of this many bytes
+PAGE_SIZE = 256
+
+#most instructions run by one fused entry, and the most bytes they cover
+MAX_FUSED = 3
+MAX_FUSED_BYTES = 9
+
+#decode entries that end a fused run, nothing is fused after them
+FUSE_ENDS = ("op_jmp", "op_jz", "op_jnz", "op_hlt", "op_error")
+
+
+def as_memory(buffer):
+    #adopt a bytearray as is, any other writable buffer through a byte memoryview
+    if isinstance(buffer, bytearray):
+        return buffer
+    view = memoryview(buffer)
+    if view.readonly:
+        raise ValueError("Memory buffer must be writable")
+    if view.format != "B" or view.ndim != 1:
+        view = view.cast("B")
+    return view
+
+
+class Snapshot:
+    #CPU state from CPU8Bit.snapshot(), pages are immutable and shared with
+    #the CPU and other snapshots until one of them writes to that page
+    __slots__ = ("reg", "IR", "Z", "C", "PC", "MAR", "halted", "pages")
+
+    def __init__(self, reg, IR, Z, C, PC, MAR, halted, pages):
+        self.reg = reg
+        self.IR = IR
+        self.Z = Z
+        self.C = C
+        self.PC = PC
+        self.MAR = MAR
+        self.halted = halted
+        self.pages = pages
+
+    def memory(self):
+        return b"".join(self.pages)
+
+
+class Image:
+    #immutable memory contents for CPUs parked on it, e.g. a program / ROM
+    #loaded once and shared by any number of guests. Equal pages are one
+    #bytes object, so an image of mostly empty memory stays small
+    __slots__ = ("data", "pages")
+
+    def __init__(self, data=b"", size=65536):
+        data = bytes(data)
+        if len(data) > size:
+            raise ValueError(f"Image of {len(data)} bytes does not fit in {size} bytes of memory")
+        self.data = data + bytes(size - len(data))
+
+        shared = {}
+        self.pages = tuple(
+            shared.setdefault(page, page)
+            for page in (self.data[i:i + PAGE_SIZE] for i in range(0, size, PAGE_SIZE))
+        )
+
+    @classmethod
+    def from_segments(cls, segments, size=65536):
+        #(origin, bytes) pairs as returned by assemble_segments
+        cpu = CPU8Bit(size)
+        cpu.load_segments(segments)
+        return cls(cpu.mem, size)
+
+
+#slots park() empties, any use of them while parked unparks the CPU first
+PARKED_SLOTS = frozenset(("mem", "decode_cache", "block_cache", "fused_cache", "code_addrs", "dirty_pages"))
+
+
+class CPU8Bit:
+    #no per instance __dict__, an idle parked CPU is the registers and the
+    #pages it changed from its image
+    __slots__ = (
+        "reg", "IR", "z_result", "c_result", "PC", "MAR", "mem", "halted",
+        "decode_cache", "block_cache", "fused_cache", "code_addrs", "base_pages", "dirty_pages",
+        "image", "overlay", "parked", "adopted",
+    )
+
+    def __init__(self, memory_size=65536, memory=None, image=None):
+        #8 bit registers R0, R1, R2, R3
+        self.reg = [0, 0, 0, 0]
+
+        #8 bit Instruction Register
+        self.IR = 0
+
+        #1 bit flags, kept as the results they come from and only worked out
+        #when read: Z = 1 when z_result is 0, C = bit 8 of c_result, the sum
+        #of the last ADD, or of the last SUB plus 256
+        self.z_result = 1
+        self.c_result = 0
+
+        #16 bit registers
+        self.PC = 0
+        self.MAR = 0
+
+        self.halted = False
+
+        #parked CPUs have no memory of their own, only the shared Image under
+        #them and the pages that differ from it, page -> bytes or None
+        self.image = image
+        self.overlay = None
+        self.parked = image is not None
+        self.base_pages = None
+
+        #the caller's buffer when memory is one, kept across park / unpark
+        self.adopted = None
+        if self.parked:
+            return
+
+        #memory: 8 bit memory, a bytearray or an adopted writable buffer
+        if memory is None:
+            self.mem = bytearray(memory_size)
+        else:
+            self.mem = self.adopted = as_memory(memory)
+
+        #decoded instructions keyed by PC: (handler, opcode, next PC, MAR, args...)
+        self.decode_cache = {}
+
+        #compiled basic blocks keyed by start PC, used by run_blocks
+        self.block_cache = {}
+
+        #decode entries with an instruction count, fused where a few
+        #instructions make up one of the op_*_* handlers, used by run
+        self.fused_cache = {}
+
+        #addresses of every memory byte that is part of a cached instruction or block
+        self.code_addrs = set()
+
+        #page images memory matched at the last snapshot / restore (base_pages,
+        #set above), and the pages written since then
+        self.dirty_pages = set()
+
+    def __getattr__(self, name):
+        #only called for empty slots
+        if name in PARKED_SLOTS and self.parked:
+            self.unpark()
+            return getattr(self, name)
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+
+    @property
+    def Z(self):
+        return 0 if self.z_result else 1
+
+    @Z.setter
+    def Z(self, value):
+        self.z_result = 0 if value else 1
+
+    @property
+    def C(self):
+        return self.c_result >> 8
+
+    @C.setter
+    def C(self, value):
+        self.c_result = 0x100 if value else 0
+
+    '''
+    Start of instructions
+    '''
+
+    def handle_nop(self, opcode, operand):
+        pass
+
+    def handle_ldi(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+
+        self.reg[r] = operand & 0xFF
+        self.set_z_flag(self.reg[r])
+
+    def handle_ld(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+
+        self.reg[r] = self.mem[self.MAR] & 0xFF
+        self.set_z_flag(self.reg[r])
+
+    def handle_st(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+
+        self.mem[self.MAR] = self.reg[r]
+        self.dirty_pages.add(self.MAR // PAGE_SIZE)
+        if self.MAR in self.code_addrs:
+            self.invalidate_code(self.MAR)
+
+    def handle_add_imm(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+
+        result = self.reg[r] + operand
+        self.reg[r] = result & 0xFF
+        self.set_c_flag_add(result)
+        self.set_z_flag(self.reg[r])
+
+    def handle_add_reg(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+        
+        r2 = operand & 0x0F
+        if r2 > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register2 {operand:02X}")
+
+
+        result = self.reg[r] + self.reg[r2]
+        self.reg[r] = result & 0xFF
+        self.set_c_flag_add(result)
+        self.set_z_flag(self.reg[r])
+
+    def handle_sub_imm(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+
+        result = self.reg[r] - operand
+        self.reg[r] = result & 0xFF
+        self.set_c_flag_sub(result)
+        self.set_z_flag(self.reg[r])
+
+    def handle_and_imm(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+
+        result = self.reg[r] & operand
+        self.reg[r] = result & 0xFF
+        self.set_z_flag(self.reg[r])
+
+    def handle_or_imm(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+
+        result = self.reg[r] | operand
+        self.reg[r] = result & 0xFF
+        self.set_z_flag(self.reg[r])
+
+    def handle_xor_imm(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+
+        result = self.reg[r] ^ operand
+        self.reg[r] = result & 0xFF
+        self.set_z_flag(self.reg[r])
+
+    def handle_jmp(self, opcode, operand):
+        self.PC = self.MAR
+
+    def handle_jz(self, opcode, operand):
+        if not self.z_result:
+            self.PC = self.MAR
+
+    def handle_jnz(self, opcode, operand):
+        if self.z_result:
+            self.PC = self.MAR
+
+    def handle_mov_reg(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+        r1 = operand & 0x0F
+        if r1 > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in operand {operand:02X}")
+        
+        self.reg[r] = self.reg[r1]
+        self.set_z_flag(self.reg[r])
+
+    def handle_ldx_regs(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+        r1 = (operand >> 4) & 0x0F
+        if r1 > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in operand {operand:02X}")
+        r2 = operand & 0x0F
+        if r2 > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in operand {operand:02X}")
+        addr = (self.reg[r1] << 8) + self.reg[r2]
+        self.reg[r] = self.mem[addr]
+        self.set_z_flag(self.reg[r])
+
+    def handle_stx_regs(self, opcode, operand):
+        r = opcode & 0x0F
+        if r > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in opcode {opcode:02X}")
+        r1 = (operand >> 4) & 0x0F
+        if r1 > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in operand {operand:02X}")
+        r2 = operand & 0x0F
+        if r2 > 3:
+            self.halted = True
+            raise ValueError(f"Invalid register in operand {operand:02X}")
+        addr = (self.reg[r1] << 8) + self.reg[r2]
+        self.mem[addr] = self.reg[r]
+        self.dirty_pages.add(addr // PAGE_SIZE)
+        if addr in self.code_addrs:
+            self.invalidate_code(addr)
+
+    def handle_hlt(self, opcode, operand):
+        self.halted = True
+
+    '''
+    End of instructions
+    '''
+
+
+    def set_z_flag(self, result):
+        self.z_result = result
+
+    def set_c_flag_add(self, result):
+        self.c_result = result
+
+    def set_c_flag_sub(self, result):
+        #no borrow sets bit 8
+        self.c_result = result + 0x100
+
+    def load_program(self, program, start=0, copy=True):
+        if not copy:
+            #adopt the image itself as memory, e.g. the bytearray from assemble()
+            if start != 0 or len(program) != len(self.mem):
+                raise ValueError("Only a full memory image at address 0 can be loaded without copying")
+            self.attach_memory(program)
+            return
+
+        if not isinstance(program, (bytes, bytearray, memoryview)):
+            program = bytes(byte & 0xFF for byte in program)
+
+        #copy in slices, wrapping at the top of the 16 bit address space
+        mem = self.mem
+        pos = start & 0xFFFF
+        offset = 0
+        while offset < len(program):
+            chunk = min(len(program) - offset, 0x10000 - pos)
+            if pos + chunk > len(mem):
+                raise IndexError(f"Program does not fit in memory at {pos:04X}")
+            mem[pos:pos + chunk] = program[offset:offset + chunk]
+            self.mark_dirty(pos, pos + chunk)
+            offset += chunk
+            pos = 0
+        self.flush_code_cache()
+
+    def load_segments(self, segments):
+        #(origin, bytes) pairs as returned by assemble_segments
+        for origin, data in segments:
+            self.load_program(data, origin)
+
+    def attach_memory(self, memory):
+        #use memory as this CPU's memory without copying it. Every slot is
+        #assigned rather than read, reading one on a parked CPU would unpark
+        #it and put a copy of its image back over memory
+        self.mem = self.adopted = as_memory(memory)
+        self.image = None
+        self.overlay = None
+        self.parked = False
+        self.base_pages = None
+        self.dirty_pages = set()
+        self.decode_cache = {}
+        self.block_cache = {}
+        self.fused_cache = {}
+        self.code_addrs = set()
+
+    def mark_dirty(self, start, end):
+        #call after writing to mem[start:end] directly, outside of ST / STX
+        self.dirty_pages.update(range(start // PAGE_SIZE, (end - 1) // PAGE_SIZE + 1))
+
+    def view(self, start=0, end=None):
+        #zero-copy view of memory for dumps and inspection, read-only: writes
+        #must go through load_program(), or mem followed by mark_dirty() and
+        #flush_code_cache(), for snapshots and the code caches to see them
+        return memoryview(self.mem)[start:end].toreadonly()
+
+    '''
+    Start of predecoded instructions
+
+    These run from the decode cache, so the register ids have already been
+    checked and the operand / address has already been fetched.
+    '''
+
+    def op_nop(self, x, y, z):
+        pass
+
+    def op_ldi(self, r, imm, z):
+        self.reg[r] = imm
+        self.z_result = imm
+
+    def op_ld(self, r, addr, z):
+        value = self.mem[addr]
+        self.reg[r] = value
+        self.z_result = value
+
+    def op_st(self, r, addr, z):
+        self.mem[addr] = self.reg[r]
+        self.dirty_pages.add(addr // PAGE_SIZE)
+        if addr in self.code_addrs:
+            self.invalidate_code(addr)
+
+    def op_add_imm(self, r, imm, z):
+        reg = self.reg
+        result = reg[r] + imm
+        value = result & 0xFF
+        reg[r] = value
+        self.c_result = result
+        self.z_result = value
+
+    def op_add_reg(self, r, r2, z):
+        reg = self.reg
+        result = reg[r] + reg[r2]
+        value = result & 0xFF
+        reg[r] = value
+        self.c_result = result
+        self.z_result = value
+
+    def op_sub_imm(self, r, imm, z):
+        reg = self.reg
+        result = reg[r] - imm + 0x100
+        value = result & 0xFF
+        reg[r] = value
+        self.c_result = result
+        self.z_result = value
+
+    def op_and_imm(self, r, imm, z):
+        value = self.reg[r] & imm
+        self.reg[r] = value
+        self.z_result = value
+
+    def op_or_imm(self, r, imm, z):
+        value = self.reg[r] | imm
+        self.reg[r] = value
+        self.z_result = value
+
+    def op_xor_imm(self, r, imm, z):
+        value = self.reg[r] ^ imm
+        self.reg[r] = value
+        self.z_result = value
+
+    def op_jmp(self, addr, y, z):
+        self.PC = addr
+
+    def op_jz(self, addr, y, z):
+        if not self.z_result:
+            self.PC = addr
+
+    def op_jnz(self, addr, y, z):
+        if self.z_result:
+            self.PC = addr
+
+    def op_mov_reg(self, r, r1, z):
+        value = self.reg[r1]
+        self.reg[r] = value
+        self.z_result = value
+
+    def op_ldx_regs(self, r, r1, r2):
+        reg = self.reg
+        value = self.mem[(reg[r1] << 8) + reg[r2]]
+        reg[r] = value
+        self.z_result = value
+
+    def op_stx_regs(self, r, r1, r2):
+        reg = self.reg
+        addr = (reg[r1] << 8) + reg[r2]
+        self.mem[addr] = reg[r]
+        self.dirty_pages.add(addr // PAGE_SIZE)
+        if addr in self.code_addrs:
+            self.invalidate_code(addr)
+
+    def op_hlt(self, x, y, z):
+        self.halted = True
+
+    def op_error(self, message, y, z):
+        self.halted = True
+        raise ValueError(message)
+
+    '''
+    End of predecoded instructions
+
+    Start of fused instructions
+
+    Each runs a sequence of predecoded instructions in one dispatch. The run
+    loop sets IR, PC and MAR as the last instruction of the sequence would,
+    nothing in between can be observed.
+    '''
+
+    def op_sub_jnz(self, r, imm, addr):
+        reg = self.reg
+        result = reg[r] - imm + 0x100
+        value = result & 0xFF
+        reg[r] = value
+        self.c_result = result
+        self.z_result = value
+        if value:
+            self.PC = addr
+
+    def op_ldi_add_reg(self, r, imm, r2):
+        reg = self.reg
+        reg[r] = imm
+        result = imm + reg[r2]
+        value = result & 0xFF
+        reg[r] = value
+        self.c_result = result
+        self.z_result = value
+
+    def op_ld_add_reg(self, r, addr, r2):
+        reg = self.reg
+        reg[r] = self.mem[addr]
+        result = reg[r] + reg[r2]
+        value = result & 0xFF
+        reg[r] = value
+        self.c_result = result
+        self.z_result = value
+
+    def op_add_reg_st(self, r, r2, addr):
+        reg = self.reg
+        result = reg[r] + reg[r2]
+        value = result & 0xFF
+        reg[r] = value
+        self.c_result = result
+        self.z_result = value
+        self.mem[addr] = value
+        self.dirty_pages.add(addr // PAGE_SIZE)
+        if addr in self.code_addrs:
+            self.invalidate_code(addr)
+
+    def op_ld_add_imm_st(self, r, src, imm_dst):
+        imm, addr = imm_dst
+        result = self.mem[src] + imm
+        value = result & 0xFF
+        self.reg[r] = value
+        self.c_result = result
+        self.z_result = value
+        self.mem[addr] = value
+        self.dirty_pages.add(addr // PAGE_SIZE)
+        if addr in self.code_addrs:
+            self.invalidate_code(addr)
+
+    def op_add_reg_sub_jnz(self, r, r2, sub_jnz):
+        s, imm, addr = sub_jnz
+        reg = self.reg
+        reg[r] = (reg[r] + reg[r2]) & 0xFF
+        result = reg[s] - imm + 0x100
+        value = result & 0xFF
+        reg[s] = value
+        self.c_result = result
+        self.z_result = value
+        if value:
+            self.PC = addr
+
+    '''
+    End of fused instructions
+    '''
+
+
+    def decode(self, pc):
+        mem = self.mem
+        opcode = mem[pc]
+        pc1 = (pc + 1) & 0xFFFF
+        mar = None
+        operand = None
+
+        #fetch length comes from the ISA table, also for invalid opcodes
+        length = FETCH_LENGTH[opcode]
+        next_pc = (pc + length) & 0xFFFF
+        if length == 3:
+            mar = (mem[(pc + 2) & 0xFFFF] << 8) | mem[pc1]
+        elif length == 2:
+            operand = mem[pc1]
+
+        #resolve the handler and check the register ids once
+        instruction = OPCODES[opcode]
+        if instruction is None:
+            entry = (self.op_error, opcode_error(opcode), None, None)
+        else:
+            args = []
+            for kind in instruction.operands:
+                if kind == REG:
+                    args.append(opcode & 0x0F)
+                elif kind == IMM:
+                    args.append(operand)
+                elif kind in (MEM, ADDR):
+                    args.append(mar)
+                elif kind == REG2:
+                    if operand & 0x0F > 3:
+                        args = None
+                        break
+                    args.append(operand & 0x0F)
+                else: #REG_PAIR
+                    if (operand >> 4) & 0x0F > 3 or operand & 0x0F > 3:
+                        args = None
+                        break
+                    args.append((operand >> 4) & 0x0F)
+                    args.append(operand & 0x0F)
+
+            if args is None:
+                entry = (self.op_error, f"{instruction.reg2_error} {operand:02X}", None, None)
+            else:
+                args += [None] * (3 - len(args))
+                entry = (getattr(self, "op_" + instruction.name), args[0], args[1], args[2])
+
+        handler, x, y, z = entry
+        entry = (handler, opcode, next_pc, mar, x, y, z)
+        self.decode_cache[pc] = entry
+
+        #mark the instruction bytes so stores into them drop the entry
+        code_addrs = self.code_addrs
+        addr = pc
+        while addr != next_pc:
+            code_addrs.add(addr)
+            addr = (addr + 1) & 0xFFFF
+        return entry
+
+    def fuse(self, pc):
+        #fused cache entry for pc, (decode entry..., instruction count)
+        cache = self.decode_cache
+        entries = []
+        names = []
+        addr = pc
+        for i in range(MAX_FUSED):
+            entry = cache.get(addr)
+            if entry is None:
+                try:
+                    entry = self.decode(addr)
+                except IndexError:
+                    if not i:
+                        raise
+                    #past the end of a small memory, raised when it is reached
+                    break
+            entries.append(entry)
+            names.append(entry[0].__name__)
+            if names[-1] in FUSE_ENDS:
+                break
+            addr = entry[2]
+
+        fused = self.match_fused(entries, names)
+        if fused is None:
+            entry = entries[0] + (1,)
+        else:
+            handler, count, x, y, z = fused
+            last = entries[count - 1]
+            mar = None
+            for entry in entries[:count]:
+                if entry[3] is not None:
+                    mar = entry[3]
+            entry = (handler, last[1], last[2], mar, x, y, z, count)
+        self.fused_cache[pc] = entry
+        return entry
+
+    def match_fused(self, entries, names):
+        #(handler, instructions, x, y, z) when the entries start with a fused
+        #sequence, else None. Memory addresses must be in range, so that an
+        #IndexError is still raised by the instruction itself.
+        size = len(self.mem)
+        a = entries[0]
+        if len(entries) >= 3:
+            b, c = entries[1], entries[2]
+            if (names[0] == "op_ld" and names[1] == "op_add_imm" and names[2] == "op_st"
+                    and a[4] == b[4] == c[4] and a[5] < size and c[5] < size):
+                return self.op_ld_add_imm_st, 3, a[4], a[5], (b[5], c[5])
+            if names[0] == "op_add_reg" and names[1] == "op_sub_imm" and names[2] == "op_jnz":
+                return self.op_add_reg_sub_jnz, 3, a[4], a[5], (b[4], b[5], c[4])
+        if len(entries) >= 2:
+            b = entries[1]
+            pair = (names[0], names[1])
+            if pair == ("op_sub_imm", "op_jnz"):
+                return self.op_sub_jnz, 2, a[4], a[5], b[4]
+            if pair == ("op_ldi", "op_add_reg") and a[4] == b[4]:
+                return self.op_ldi_add_reg, 2, a[4], a[5], b[5]
+            if pair == ("op_ld", "op_add_reg") and a[4] == b[4] and a[5] < size:
+                return self.op_ld_add_reg, 2, a[4], a[5], b[5]
+            if pair == ("op_add_reg", "op_st") and a[4] == b[4] and b[5] < size:
+                return self.op_add_reg_st, 2, a[4], a[5], b[5]
+        return None
+
+    def invalidate_code(self, addr):
+        #an instruction covering addr starts at most 2 bytes before it
+        cache = self.decode_cache
+        cache.pop(addr, None)
+        cache.pop((addr - 1) & 0xFFFF, None)
+        cache.pop((addr - 2) & 0xFFFF, None)
+        self.code_addrs.discard(addr)
+
+        #and a fused run covering it at most MAX_FUSED_BYTES - 1 bytes before it
+        fused = self.fused_cache
+        if fused:
+            for offset in range(MAX_FUSED_BYTES):
+                fused.pop((addr - offset) & 0xFFFF, None)
+
+        blocks = self.block_cache
+        if blocks:
+            for start in [start for start, block in blocks.items() if block.covers(addr)]:
+                del blocks[start]
+
+    def flush_code_cache(self):
+        #call after writing to mem directly, outside of ST / STX
+        self.decode_cache.clear()
+        self.fused_cache.clear()
+        self.block_cache.clear()
+        self.code_addrs.clear()
+
+    def snapshot(self):
+        #copies only the pages written since the last snapshot / restore
+        mem = self.mem
+        if self.base_pages is None:
+            image = bytes(mem)
+            pages = [image[i:i + PAGE_SIZE] for i in range(0, len(image), PAGE_SIZE)]
+        else:
+            pages = list(self.base_pages)
+            for page in self.dirty_pages:
+                pages[page] = bytes(mem[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])
+        self.base_pages = tuple(pages)
+        self.dirty_pages.clear()
+
+        return Snapshot(tuple(self.reg), self.IR, self.Z, self.C, self.PC, self.MAR, self.halted, self.base_pages)
+
+    def restore(self, snapshot):
+        #copies back only the pages that differ from the snapshot
+        pages = snapshot.pages
+        base = self.base_pages
+        if base is pages:
+            changed = set(self.dirty_pages)
+        elif base is None or len(base) != len(pages):
+            if sum(len(page) for page in pages) != len(self.mem):
+                raise ValueError("Snapshot memory size does not match")
+            changed = set(range(len(pages)))
+        else:
+            changed = self.dirty_pages.union([i for i, page in enumerate(base) if page is not pages[i]])
+
+        mem = self.mem
+        for page in changed:
+            mem[page * PAGE_SIZE:(page + 1) * PAGE_SIZE] = pages[page]
+        if changed and self.code_addrs:
+            for addr in [addr for addr in self.code_addrs if addr // PAGE_SIZE in changed]:
+                self.invalidate_code(addr)
+        self.base_pages = pages
+        self.dirty_pages.clear()
+
+        self.reg = list(snapshot.reg)
+        self.IR = snapshot.IR
+        self.Z = snapshot.Z
+        self.C = snapshot.C
+        self.PC = snapshot.PC
+        self.MAR = snapshot.MAR
+        self.halted = snapshot.halted
+
+    def park(self, image=None):
+        #frees this CPU's memory and code caches, keeping only the pages that
+        #differ from image: by default the image it was parked on before, or
+        #else one of its current memory. Registers are kept, and any later use
+        #of memory unparks it again
+        if self.parked:
+            if image is None or image is self.image:
+                return
+            self.unpark()
+
+        if self.adopted is not None:
+            #the memory is the caller's buffer and stays as it is, only the
+            #code caches are freed and image is not used. Unparking takes the
+            #buffer up again, with anything written to it in the meantime
+            self.base_pages = None
+            for name in PARKED_SLOTS:
+                delattr(self, name)
+            self.parked = True
+            return
+
+        mem = self.mem
+        if image is None:
+            image = self.image if self.image is not None else Image(mem, len(mem))
+        elif len(image.data) != len(mem):
+            raise ValueError("Image size does not match memory")
+
+        #pages are compared against the image only where they may differ
+        base = self.base_pages
+        if image is self.image and base is not None:
+            pages = self.dirty_pages.union([i for i, page in enumerate(base) if page is not image.pages[i]])
+        else:
+            pages = range(len(image.pages))
+
+        overlay = {}
+        view = memoryview(mem)
+        data = image.data
+        for page in pages:
+            start = page * PAGE_SIZE
+            chunk = view[start:start + PAGE_SIZE]
+            if chunk != data[start:start + PAGE_SIZE]:
+                overlay[page] = bytes(chunk)
+        view.release()
+
+        self.image = image
+        self.overlay = overlay or None
+        self.base_pages = None
+        for name in PARKED_SLOTS:
+            delattr(self, name)
+        self.parked = True
+
+    def unpark(self):
+        #private memory again: a copy of the image with the overlay on it, or
+        #the adopted buffer, which may have been written while parked
+        if self.adopted is not None:
+            self.mem = self.adopted
+            self.base_pages = None
+        else:
+            image = self.image
+            mem = bytearray(image.data)
+            pages = image.pages
+            if self.overlay:
+                pages = list(pages)
+                for page, data in self.overlay.items():
+                    mem[page * PAGE_SIZE:(page + 1) * PAGE_SIZE] = data
+                    pages[page] = data
+                pages = tuple(pages)
+
+            self.mem = mem
+            self.base_pages = pages
+        self.dirty_pages = set()
+        self.decode_cache = {}
+        self.block_cache = {}
+        self.fused_cache = {}
+        self.code_addrs = set()
+        self.overlay = None
+        self.parked = False
+
+    def execute(self, opcode, operand):
+        #exact instructions first
+        handler = self.opcode_handlers.get(opcode)
+        if handler is not None:
+            handler(self, opcode, operand)
+            return
+
+        #else use the high nibble
+        hi = opcode & 0xF0
+        handler = self.hi_handlers.get(hi)
+        if handler is None:
+            self.halted = True
+            raise ValueError(f"Unknown opcode {opcode:02X}")
+
+        handler(self, opcode, operand)
+
+    def reference_step(self):
+        #step() as the original interpreter did it: fetch byte by byte and
+        #dispatch through execute() to the handle_* methods. Slow, and on
+        #purpose shares no decoding with step() and the engines built on the
+        #op_* handlers, difftest checks all of them against this
+        if self.halted:
+            return
+
+        #fetch opcode
+        opcode = self.mem[self.PC & 0xFFFF]
+        self.IR = opcode
+        self.PC = (self.PC + 1) & 0xFFFF
+
+        operand = None
+        hi = opcode & 0xF0
+
+        #fetch operands and MAR and advance PC
+        if opcode in (0x00, 0xFF):
+            pass
+
+        elif hi in (0x20, 0x30) or opcode in (0xA0, 0xA1, 0xA2):   #LD/ST r,addr and JMP/JZ/JNZ addr
+            loB = self.mem[self.PC]
+            self.PC = (self.PC + 1) & 0xFFFF
+            hiB = self.mem[self.PC]
+            self.PC = (self.PC + 1) & 0xFFFF
+            self.MAR = (hiB << 8) | loB
+
+        else:
+            #2-byte instructions
+            operand = self.mem[self.PC]
+            self.PC = (self.PC + 1) & 0xFFFF
+
+        #execute
+        self.execute(opcode, operand)
+
+
+    def step(self):
+        if self.halted:
+            return
+
+        #fetch and decode, the cache holds every instruction already seen at this PC
+        pc = self.PC & 0xFFFF
+        entry = self.decode_cache.get(pc)
+        if entry is None:
+            entry = self.decode(pc)
+
+        handler, opcode, next_pc, mar, x, y, z = entry
+        self.IR = opcode
+        self.PC = next_pc
+        if mar is not None:
+            self.MAR = mar
+
+        #execute
+        handler(x, y, z)
+
+        
+    def run(self, max_cycles=100000, trace=False, profile=None, debug=None, coverage=None):
+        if coverage is not None:
+            #cover.Coverage sets bits for the PCs and branch edges it runs
+            return coverage.run(self, max_cycles)
+
+        if debug is not None:
+            #debugger.Debugger returns early when a breakpoint or watchpoint is hit
+            return debug.run(self, max_cycles)
+
+        if profile is not None:
+            #profiler.Profiler runs its own counting copy of this loop
+            return profile.run(self, max_cycles)
+
+        if trace is True:
+            from .tracer import Tracer, format_record
+
+            #print the run once it stops, from an in-memory trace of the last cycles
+            tracer = Tracer(max(1, min(max_cycles, 1 << 20)))
+            try:
+                return tracer.run(self, max_cycles)
+            finally:
+                for record in tracer.records():
+                    print(format_record(record))
+        elif trace:
+            #tracer.Tracer records its own copy of this loop
+            return trace.run(self, max_cycles)
+
+        cycles = self.advance(max_cycles)
+        if cycles >= max_cycles:
+            raise ValueError("Max cpu cycles exceeded")
+        return cycles
+
+    def run_blocks(self, max_cycles=100000, fast_loops=True):
+        #same results as run(), but executes a compiled basic block per call,
+        #and with fast_loops a whole counted loop per call where it can
+        cycles = self.advance_blocks(max_cycles, fast_loops)
+        if cycles >= max_cycles:
+            raise ValueError("Max cpu cycles exceeded")
+        return cycles
+
+    def advance(self, max_cycles):
+        #runs up to max_cycles instructions and returns how many ran, stopping
+        #early only at HLT. Running out of cycles is not an error here, the
+        #CPU is left between instructions and the next call carries on. An
+        #invalid instruction raises with the instructions run before it as
+        #the exception's `cycles`.
+
+        #step() inlined, running fused entries while there is budget for the
+        #longest one, then the last few cycles one instruction at a time.
+        #Fused entries never hold an instruction that can raise, so cycles is
+        #exact when one does.
+        cycles = 0
+        fused = self.fused_cache
+        fuse = self.fuse
+        limit = max_cycles - MAX_FUSED + 1
+        try:
+            while not self.halted and cycles < limit:
+                pc = self.PC & 0xFFFF
+                entry = fused.get(pc)
+                if entry is None:
+                    entry = fuse(pc)
+                handler, self.IR, self.PC, mar, x, y, z, count = entry
+                if mar is not None:
+                    self.MAR = mar
+                handler(x, y, z)
+                cycles += count
+
+            cache = self.decode_cache
+            decode = self.decode
+            while not self.halted and cycles < max_cycles:
+                pc = self.PC & 0xFFFF
+                entry = cache.get(pc)
+                if entry is None:
+                    entry = decode(pc)
+                handler, self.IR, self.PC, mar, x, y, z = entry
+                if mar is not None:
+                    self.MAR = mar
+                handler(x, y, z)
+                cycles += 1
+        except (ValueError, IndexError) as e:
+            e.cycles = cycles
+            raise
+        return cycles
+
+    def advance_blocks(self, max_cycles, fast_loops=True):
+        #advance() through compiled blocks, as run_blocks() does, with the
+        #same `cycles` on the exception of an invalid instruction
+        if len(self.mem) < 65536:
+            #blocks index memory without bounds checks
+            return self.advance(max_cycles)
+
+        #blocks end before an invalid instruction, only step() raises
+        cycles = 0
+        blocks = self.block_cache
+        try:
+            while not self.halted and cycles < max_cycles:
+                pc = self.PC & 0xFFFF
+                block = blocks.get(pc)
+                if block is None:
+                    block = compile_block(self, pc)
+                    if block is not None:
+                        blocks[pc] = block
+
+                if block is None or cycles + block.count > max_cycles:
+                    #invalid instruction, or not enough budget left for the whole block
+                    self.step()
+                    cycles += 1
+                else:
+                    if fast_loops and block.loop is not None:
+                        executed = block.loop(self, self.reg, max_cycles - cycles)
+                        if executed:
+                            cycles += executed
+                            continue
+                    cycles += block.fn(self, self.reg, self.mem, self.code_addrs)
+        except (ValueError, IndexError) as e:
+            e.cycles = cycles
+            raise
+        return cycles
+
+
+#dispatch tables of execute(), shared by every CPU. Written out rather than
+#built from the isa.py table, so that the reference interpreter does not
+#share its opcode map with the engines it checks
+#exact opcode handlers (1 opcode = 1 meaning)
+CPU8Bit.opcode_handlers = {
+    0x00: CPU8Bit.handle_nop,
+    0xFF: CPU8Bit.handle_hlt,
+    0xA0: CPU8Bit.handle_jmp,
+    0xA1: CPU8Bit.handle_jz,
+    0xA2: CPU8Bit.handle_jnz,
+}
+
+#high-nibble handlers (0x1_ means a family of instructions)
+CPU8Bit.hi_handlers = {
+    0x10: CPU8Bit.handle_ldi,
+    0x20: CPU8Bit.handle_ld,
+    0x30: CPU8Bit.handle_st,
+    0x40: CPU8Bit.handle_add_imm,
+    0x50: CPU8Bit.handle_add_reg,
+    0x60: CPU8Bit.handle_sub_imm,
+    0x70: CPU8Bit.handle_and_imm,
+    0x80: CPU8Bit.handle_or_imm,
+    0x90: CPU8Bit.handle_xor_imm,
+    0xB0: CPU8Bit.handle_mov_reg,
+    0xC0: CPU8Bit.handle_ldx_regs,
+    0xD0: CPU8Bit.handle_stx_regs,
+}
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    from .assembler import assemble
+
+    #the program given, or programs/program.asm of the source checkout
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "programs", "program.asm")
+    machine_code = assemble(path)
+    cpu = CPU8Bit()
+    cpu.load_program(machine_code)
+    cpu.run()
+    '''
+    output = ""
+    for i in range(0x2000, 0x2400):
+        output = output + f"{cpu.mem[i]:02X} "
+        if i % 32 == 31:
+            output = output + "\n"
+    print(output)
+    '''
@@ -0,0 +1,262 @@
+'''
+Breakpoints and memory watchpoints for CPU8Bit.
+
+Debugger.run is another copy of the CPU8Bit.run loop, used through
+cpu.run(max_cycles, debug=debugger). With nothing armed it hands straight
+over to the block engine, so a debugger left attached costs nothing. With
+breakpoints and watchpoints it still runs compiled blocks, see run_blocks;
+only conditions, which are checked before every instruction, need the
+instruction at a time loop for the whole run.
+
+    debugger = Debugger()
+    debugger.add_breakpoint(0x0010, lambda cpu: cpu.reg[1] == 3)
+    debugger.add_watchpoint(0x2000, 0x2100, read=True, write=True)
+    cycles = cpu.run(max_cycles, debug=debugger)
+    if debugger.hit:
+        print(debugger.hit)
+
+Breakpoints and conditions stop before the instruction at the PC runs,
+watchpoints stop after the LD / LDX / ST / STX that touched the range. Calling
+run again carries on from there, without stopping at the same breakpoint
+again first.
+
+Watched ranges are trapped by page: a block only runs one instruction at a
+time when one of its LD / ST addresses is on a watched page, or it has an
+LDX / STX while that kind of access is watched. Those accesses look their
+page up in a 256 entry table, and the ranges themselves are only checked
+for pages that hold one.
+'''
+
+from .blocks import compile_block
+from .isa import OPCODES
+
+#memory pages of this many bytes, the page table covers the 16 bit address space
+PAGE_SIZE = 256
+
+#access bits in the page table
+READ = 1
+WRITE = 2
+
+#what each opcode accesses: 0, or (access bit, address from MAR / register pair)
+NAME_ACCESS = {
+    "ld": (READ, False),
+    "st": (WRITE, False),
+    "ldx_regs": (READ, True),
+    "stx_regs": (WRITE, True),
+}
+
+ACCESS = [0 if instruction is None else NAME_ACCESS.get(instruction.name, 0) for instruction in OPCODES]
+
+
+class Hit:
+    #why the last Debugger.run stopped
+    def __init__(self, kind, pc, cycle, addr=None):
+        self.kind = kind        #"breakpoint", "condition", "read" or "write"
+        self.pc = pc            #address of the instruction it stopped before / after
+        self.cycle = cycle      #cycles run in that call before stopping
+        self.addr = addr        #memory address for watchpoints
+
+    def __repr__(self):
+        addr = "" if self.addr is None else f" addr={self.addr:04X}"
+        return f"Hit({self.kind} pc={self.pc:04X}{addr} cycle={self.cycle})"
+
+
+class Debugger:
+    def __init__(self):
+        self.breakpoints = {}   #PC -> condition(cpu) or None
+        self.conditions = []    #condition(cpu), checked before every instruction
+        self.watchpoints = []   #(start, end, access bits), end excluded
+        self.pages = bytearray(0x10000 // PAGE_SIZE)
+        self.hit = None
+
+        #PC stopped before, its checks are skipped once when the run carries on
+        self.stop_pc = None
+
+    @property
+    def armed(self):
+        return bool(self.breakpoints or self.conditions or self.watchpoints)
+
+    def add_breakpoint(self, pc, condition=None):
+        #stops before pc when condition(cpu) is true, or always without one
+        self.breakpoints[pc & 0xFFFF] = condition
+
+    def remove_breakpoint(self, pc):
+        self.breakpoints.pop(pc & 0xFFFF, None)
+
+    def add_condition(self, condition):
+        #stops before any instruction when condition(cpu) is true
+        self.conditions.append(condition)
+
+    def remove_condition(self, condition):
+        self.conditions.remove(condition)
+
+    def add_watchpoint(self, start, end=None, read=False, write=True):
+        #stops after an access to [start, end), a single byte without end
+        end = start + 1 if end is None else end
+        if not (0 <= start < end <= 0x10000):
+            raise ValueError(f"Bad watch range {start:#x}-{end:#x}")
+        access = (READ if read else 0) | (WRITE if write else 0)
+        if not access:
+            raise ValueError("Watchpoint must watch reads, writes or both")
+        watch = (start, end, access)
+        self.watchpoints.append(watch)
+        self.map_pages()
+        return watch
+
+    def remove_watchpoint(self, watch):
+        self.watchpoints.remove(watch)
+        self.map_pages()
+
+    def map_pages(self):
+        pages = self.pages
+        pages[:] = bytes(len(pages))
+        for start, end, access in self.watchpoints:
+            for page in range(start // PAGE_SIZE, (end - 1) // PAGE_SIZE + 1):
+                pages[page] |= access
+
+    def watched(self, addr, access):
+        for start, end, bits in self.watchpoints:
+            if start <= addr < end and bits & access:
+                return True
+        return False
+
+    def run(self, cpu, max_cycles=100000, fast_loops=True):
+        #CPU8Bit.run that returns early when something is hit, same results
+        #and errors otherwise
+        self.hit = None
+        if not self.armed:
+            self.stop_pc = None
+            cycles = cpu.advance_blocks(max_cycles, fast_loops)
+        elif self.conditions or len(cpu.mem) < 0x10000:
+            cycles = self.run_checked(cpu, max_cycles)
+        else:
+            cycles = self.run_blocks(cpu, max_cycles, fast_loops)
+
+        if self.hit is None and cycles >= max_cycles:
+            raise ValueError("Max cpu cycles exceeded")
+        return cycles
+
+    def run_blocks(self, cpu, max_cycles, fast_loops=True):
+        #CPU8Bit.advance_blocks with blocks ending before breakpoints, so they
+        #are only checked between blocks, and the blocks that can touch a
+        #watched page run through run_checked
+        breakpoints = self.breakpoints
+        blocks = cpu.block_cache
+        self.split_blocks(blocks)
+        watched = {}    #block -> whether it can touch a watched page
+        skip = self.stop_pc if self.stop_pc == cpu.PC & 0xFFFF else None
+        self.stop_pc = None
+
+        cycles = 0
+        while not cpu.halted and cycles < max_cycles:
+            pc = cpu.PC & 0xFFFF
+            if pc in breakpoints and pc != skip:
+                condition = breakpoints[pc]
+                if condition is None or condition(cpu):
+                    self.stop(pc, "breakpoint", cycles)
+                    break
+            skip = None
+
+            block = blocks.get(pc)
+            if block is None:
+                block = compile_block(cpu, pc, breakpoints)
+                if block is not None:
+                    blocks[pc] = block
+
+            if block is None or cycles + block.count > max_cycles or self.touches_watch(cpu, block, watched):
+                #the breakpoint at pc is checked already, run_checked skips it
+                self.stop_pc = pc
+                executed = self.run_checked(cpu, 1 if block is None else min(block.count, max_cycles - cycles))
+                if self.hit is not None:
+                    #counted from the start of this run, not of run_checked
+                    self.hit.cycle += cycles
+                    cycles += executed
+                    break
+                cycles += executed
+                continue
+
+            if fast_loops and block.loop is not None and pc not in breakpoints:
+                executed = block.loop(cpu, cpu.reg, max_cycles - cycles)
+                if executed:
+                    cycles += executed
+                    continue
+            cycles += block.fn(cpu, cpu.reg, cpu.mem, cpu.code_addrs)
+        return cycles
+
+    def split_blocks(self, blocks):
+        #drops cached blocks that run past a breakpoint, compiled before it was set
+        breakpoints = self.breakpoints
+        for start in [start for start, block in blocks.items() if not breakpoints.keys().isdisjoint(block.pcs[1:])]:
+            del blocks[start]
+
+    def touches_watch(self, cpu, block, watched):
+        result = watched.get(block)
+        if result is None:
+            result = False
+            if self.watchpoints:
+                pages = self.pages
+                pair_access = 0
+                for _, _, bits in self.watchpoints:
+                    pair_access |= bits
+                for addr in block.pcs:
+                    entry = cpu.decode_cache.get(addr)
+                    if entry is None:
+                        entry = cpu.decode(addr)
+                    access = ACCESS[entry[1]]
+                    if access and (pair_access if access[1] else pages[entry[3] // PAGE_SIZE]) & access[0]:
+                        result = True
+                        break
+            watched[block] = result
+        return result
+
+    def run_checked(self, cpu, max_cycles):
+        cache = cpu.decode_cache
+        decode = cpu.decode
+        breakpoints = self.breakpoints
+        conditions = self.conditions
+        pages = self.pages
+        skip = self.stop_pc if self.stop_pc == cpu.PC & 0xFFFF else None
+        self.stop_pc = None
+
+        cycles = 0
+        while not cpu.halted and cycles < max_cycles:
+            pc = cpu.PC & 0xFFFF
+            if pc != skip:
+                if pc in breakpoints:
+                    condition = breakpoints[pc]
+                    if condition is None or condition(cpu):
+                        self.stop(pc, "breakpoint", cycles)
+                        break
+                if conditions and any(condition(cpu) for condition in conditions):
+                    self.stop(pc, "condition", cycles)
+                    break
+            skip = None
+
+            entry = cache.get(pc)
+            if entry is None:
+                entry = decode(pc)
+            handler, opcode, next_pc, mar, x, y, z = entry
+
+            access = ACCESS[opcode]
+            if access:
+                if access[1]:
+                    #y is None when the register pair is invalid, the handler raises
+                    addr = None if y is None else (cpu.reg[y] << 8) + cpu.reg[z]
+                else:
+                    addr = mar
+
+            cpu.IR = opcode
+            cpu.PC = next_pc
+            if mar is not None:
+                cpu.MAR = mar
+            handler(x, y, z)
+            cycles += 1
+
+            if access and pages[addr // PAGE_SIZE] & access[0] and self.watched(addr, access[0]):
+                self.hit = Hit("read" if access[0] == READ else "write", pc, cycles, addr)
+                break
+        return cycles
+
+    def stop(self, pc, kind, cycles):
+        self.hit = Hit(kind, pc, cycles)
+        self.stop_pc = pc
@@ -0,0 +1,572 @@
+'''
+Differential testing of the CPU8Bit engines against the reference interpreter.
+
+Random valid programs are generated from the instruction table in isa.py
+(the opcode map the README documents), with random initial registers and
+data. Each one runs on a reference CPU one reference_step() at a time and,
+in lockstep, on a second CPU through an engine from ENGINES. reference_step()
+is the original fetch / execute() interpreter over the handle_* methods, it
+shares no decoding or handlers with step() and the engines, so a mistake in
+the decode tables or an op_* handler shows up instead of agreeing with
+itself. The engine is given a small
+random budget at a time, so it stops at block boundaries, and after every
+stop both CPUs must agree on reg, Z, C, PC, MAR, IR, halted and all of
+memory, and on the error when an instruction raises.
+
+    failures = run_cases(range(10000), ["blocks", "loops"], workers=8)
+    for failure in failures:
+        print(failure.message)
+        print(failure.case.source())
+
+A failing case is shrunk before it is reported: instructions are removed,
+and operands, registers and data made simpler, for as long as the engine
+still disagrees with the reference. Case.job() gives the same case as a runner job.
+
+    cpu8 difftest --cases 10000 --engines blocks loops
+
+The batch engine runs the case on BatchCPU lanes instead, each lane with its
+own initial registers, and compares every lane with its own reference CPU. It
+needs NumPy and is left out of the default engines without it.
+'''
+
+import os
+import random
+import sys
+from importlib.util import find_spec
+
+from .cover import Coverage
+from .cpu import CPU8Bit
+from .debugger import Debugger
+from .isa import ADDR, IMM, INSTRUCTIONS, MEM, REG, REG2
+
+DEFAULT_MAX_CYCLES = 2000
+
+#instructions per generated program, before the closing HLT
+MAX_PROGRAM_LEN = 40
+
+#data area the generated LD / ST addresses mostly point at, after the code
+DATA_START = 0x0100
+DATA_END = 0x0200
+
+#cycles an engine may run before the next comparison
+BUDGETS = (1, 2, 3, 5, 8, 13, 64, 1000)
+
+#BatchCPU lanes per case in the batch engine
+BATCH_LANES = 4
+
+#cases per task sent to a worker
+DEFAULT_BATCH = 50
+
+#most cases tried while shrinking one failure
+MAX_SHRINK_TRIES = 2000
+
+IMMEDIATES = (0x00, 0x01, 0x02, 0x7F, 0x80, 0xFE, 0xFF)
+
+#register only instructions for the bodies of generated counted loops
+LOOP_BODY = [instruction for instruction in INSTRUCTIONS if set(instruction.operands) <= {REG, IMM, REG2}]
+
+BY_NAME = {instruction.name: instruction for instruction in INSTRUCTIONS}
+
+
+def engine_step(cpu, budget):
+    cycles = 0
+    while cycles < budget and not cpu.halted:
+        cpu.step()
+        cycles += 1
+    return cycles
+
+
+def engine_advance(cpu, budget):
+    return cpu.advance(budget)
+
+
+def engine_blocks(cpu, budget):
+    return cpu.advance_blocks(budget, fast_loops=False)
+
+
+def engine_loops(cpu, budget):
+    return cpu.advance_blocks(budget, fast_loops=True)
+
+
+def engine_parked(cpu, budget):
+    #blocks, from a CPU parked on its own memory in between
+    cpu.park()
+    return cpu.advance_blocks(budget)
+
+
+def engine_attached(cpu, budget):
+    #blocks, on memory attached to the CPU while it is parked on other contents
+    memory = bytearray(cpu.mem)
+    cpu.attach_memory(bytearray(len(memory)))
+    cpu.park()
+    cpu.attach_memory(memory)
+    if cpu.mem is not memory:
+        raise AssertionError("attach_memory on a parked CPU did not adopt the buffer")
+    return cpu.advance_blocks(budget)
+
+
+def engine_coverage(cpu, budget):
+    return Coverage().advance(cpu, budget)
+
+
+def engine_checked(cpu, budget):
+    #the Debugger loop with a condition armed that never stops it
+    debugger = Debugger()
+    debugger.add_condition(lambda cpu: False)
+    return debugger.run_checked(cpu, budget)
+
+
+def engine_debugger(cpu, budget):
+    #the Debugger block loop with breakpoints and a watchpoint on the data
+    #area, run again after every stop
+    debugger = Debugger()
+    for pc in range(0, DATA_START, 5):
+        debugger.add_breakpoint(pc)
+    debugger.add_watchpoint(DATA_START, DATA_START + 0x40, read=True, write=True)
+    cycles = 0
+    while cycles < budget and not cpu.halted:
+        #carry on from wherever it stopped last
+        debugger.stop_pc = cpu.PC & 0xFFFF
+        debugger.hit = None
+        cycles += debugger.run_blocks(cpu, budget - cycles)
+    return cycles
+
+
+#name -> engine(cpu, budget) -> cycles run, which is less than budget only
+#when the CPU halted, as CPU8Bit.advance
+ENGINES = {
+    "step": engine_step,
+    "advance": engine_advance,
+    "blocks": engine_blocks,
+    "loops": engine_loops,
+    "parked": engine_parked,
+    "attached": engine_attached,
+    "coverage": engine_coverage,
+    "checked": engine_checked,
+    "debugger": engine_debugger,
+}
+
+#every engine name, the batch engine is checked by check_batch
+ENGINE_NAMES = list(ENGINES) + ["batch"]
+
+#engines run by default, batch only when NumPy is installed
+DEFAULT_ENGINES = ENGINE_NAMES if find_spec("numpy") is not None else list(ENGINES)
+
+
+class Case:
+    #ops are (Instruction, args) with one arg per operand: a register id,
+    #a byte, an address, an (R1, R2) pair, or for ADDR the index of the op
+    #jumped to, len(ops) being the HLT after the last one
+    def __init__(self, ops, registers, memory, max_cycles=DEFAULT_MAX_CYCLES, seed=0):
+        self.ops = ops
+        self.registers = registers  #initial R0-R3
+        self.memory = memory        #address -> initial byte
+        self.max_cycles = max_cycles
+        self.seed = seed            #for the engine budgets
+
+    def replace(self, **changes):
+        fields = dict(ops=self.ops, registers=self.registers, memory=self.memory, max_cycles=self.max_cycles, seed=self.seed)
+        fields.update(changes)
+        return Case(**fields)
+
+    def offsets(self):
+        #address of each op, and of the closing HLT
+        offsets = [0]
+        for instruction, _ in self.ops:
+            offsets.append(offsets[-1] + instruction.length)
+        return offsets
+
+    def program(self):
+        offsets = self.offsets()
+        out = bytearray()
+        for instruction, args in self.ops:
+            opcode = instruction.opcode
+            operands = bytearray()
+            for kind, value in zip(instruction.operands, args):
+                if kind == REG:
+                    opcode += value
+                elif kind in (IMM, REG2):
+                    operands.append(value)
+                elif kind == MEM:
+                    operands += value.to_bytes(2, "little")
+                elif kind == ADDR:
+                    operands += offsets[value].to_bytes(2, "little")
+                else:
+                    operands.append(value[0] << 4 | value[1])
+            out.append(opcode)
+            out += operands
+        out.append(BY_NAME["hlt"].opcode)
+        return bytes(out)
+
+    def cpu(self):
+        cpu = CPU8Bit()
+        cpu.load_program(self.program())
+        for addr, value in self.memory.items():
+            cpu.load_program(bytes((value,)), addr)
+        cpu.reg = list(self.registers)
+        return cpu
+
+    def source(self):
+        #assembly for the program, with the initial state in comments
+        targets = {args[0] for instruction, args in self.ops if ADDR in instruction.operands}
+        lines = [f";registers {' '.join(f'R{i}={value:02X}' for i, value in enumerate(self.registers))}"]
+        for addr, value in sorted(self.memory.items()):
+            lines.append(f";memory [0x{addr:04X}] = {value:02X}")
+        for i, (instruction, args) in enumerate(self.ops):
+            if i in targets:
+                lines.append(f"L{i}:")
+            lines.append(f"  {format_op(instruction, args)}")
+        if len(self.ops) in targets:
+            lines.append(f"L{len(self.ops)}:")
+        lines.append("  HLT")
+        return "\n".join(lines)
+
+    def job(self):
+        #runner job with this program and initial state
+        return {
+            "image": self.program().hex(),
+            "registers": list(self.registers),
+            "memory": {f"0x{addr:04X}": [value] for addr, value in sorted(self.memory.items())},
+            "max_cycles": self.max_cycles,
+        }
+
+
+def format_op(instruction, args):
+    operands = []
+    for kind, value in zip(instruction.operands, args):
+        if kind in (REG, REG2):
+            operands.append(f"R{value}")
+        elif kind == IMM:
+            operands.append(f"#{value}")
+        elif kind == MEM:
+            operands.append(f"[0x{value:04X}]")
+        elif kind == ADDR:
+            operands.append(f"L{value}")
+        else:
+            operands.append(f"[R{value[0]}:R{value[1]}]")
+    return f"{instruction.mnemonic} {', '.join(operands)}".rstrip()
+
+
+def random_args(rng, instruction, code_end):
+    #ADDR targets are left as None, filled in once the program is complete
+    args = []
+    for kind in instruction.operands:
+        if kind in (REG, REG2):
+            args.append(rng.randrange(4))
+        elif kind == IMM:
+            args.append(rng.choice(IMMEDIATES) if rng.randrange(2) else rng.randrange(256))
+        elif kind == MEM:
+            roll = rng.random()
+            if roll < 0.8:
+                args.append(rng.randrange(DATA_START, DATA_END))
+            elif roll < 0.9:
+                #into the program itself
+                args.append(rng.randrange(code_end))
+            else:
+                args.append(rng.randrange(0x10000))
+        elif kind == ADDR:
+            args.append(None)
+        else:
+            args.append((rng.randrange(4), rng.randrange(4)))
+    return tuple(args)
+
+
+def random_case(seed, max_cycles=DEFAULT_MAX_CYCLES):
+    rng = random.Random(seed)
+    length = rng.randrange(1, MAX_PROGRAM_LEN + 1)
+    code_end = length * 3
+
+    ops = []
+    while len(ops) < length:
+        if rng.random() < 0.15:
+            #a counted loop: LDI c, #n / body / SUB c, #1 / JNZ body
+            counter = rng.randrange(4)
+            ops.append((BY_NAME["ldi"], (counter, rng.randrange(1, 40))))
+            start = len(ops)
+            for _ in range(rng.randrange(1, 4)):
+                instruction = rng.choice(LOOP_BODY)
+                args = list(random_args(rng, instruction, code_end))
+                if instruction.operands and instruction.operands[0] == REG:
+                    args[0] = rng.choice([r for r in range(4) if r != counter])
+                ops.append((instruction, tuple(args)))
+            ops.append((BY_NAME["sub_imm"], (counter, 1)))
+            ops.append((BY_NAME["jnz"], (start,)))
+        else:
+            instruction = rng.choice(INSTRUCTIONS)
+            ops.append((instruction, random_args(rng, instruction, code_end)))
+
+    ops = [
+        (instruction, tuple(rng.randrange(len(ops) + 1) if value is None else value for value in args))
+        for instruction, args in ops
+    ]
+    registers = [rng.randrange(256) for _ in range(4)]
+    memory = {rng.randrange(DATA_START, DATA_END): rng.randrange(256) for _ in range(rng.randrange(8))}
+    return Case(ops, registers, memory, max_cycles, seed)
+
+
+def state(cpu):
+    return {
+        "reg": list(cpu.reg),
+        "Z": cpu.Z,
+        "C": cpu.C,
+        "PC": cpu.PC,
+        "MAR": cpu.MAR,
+        "IR": cpu.IR,
+        "halted": cpu.halted,
+    }
+
+
+def compare(expected, actual):
+    #first difference between two CPUs, or None
+    want = state(expected)
+    got = state(actual)
+    for name in want:
+        if want[name] != got[name]:
+            return f"{name} {want[name]} != {got[name]}"
+    if expected.mem != actual.mem:
+        addr = next(i for i, (a, b) in enumerate(zip(expected.mem, actual.mem)) if a != b)
+        return f"mem[{addr:04X}] {expected.mem[addr]:02X} != {actual.mem[addr]:02X}"
+    return None
+
+
+class Lane:
+    #one BatchCPU lane with the attributes state() and compare() read
+    def __init__(self, batch, i):
+        self.reg = [int(v) for v in batch.reg[i]]
+        self.Z = int(batch.Z[i])
+        self.C = int(batch.C[i])
+        self.PC = int(batch.PC[i])
+        self.MAR = int(batch.MAR[i])
+        self.IR = int(batch.IR[i])
+        self.halted = bool(batch.halted[i])
+        self.mem = bytearray(batch.mem[i].tobytes())
+
+
+def check_batch(case, lanes=BATCH_LANES):
+    #runs case on BatchCPU lanes and each lane on its own reference CPU, lane 0
+    #with the registers of case and the others with random ones, returns the
+    #first disagreement as a message, None if they agree all the way
+    from .batch import BatchCPU
+
+    rng = random.Random(case.seed)
+    registers = [list(case.registers)] + [[rng.randrange(256) for _ in range(4)] for _ in range(lanes - 1)]
+    references = [case.replace(registers=lane_registers).cpu() for lane_registers in registers]
+    batch = BatchCPU(lanes)
+    batch.load_program(references[0].mem)
+    for i, lane_registers in enumerate(registers):
+        batch.reg[i] = lane_registers
+
+    cycles = 0
+    while cycles < case.max_cycles and not all(reference.halted for reference in references):
+        budget = min(rng.choice(BUDGETS), case.max_cycles - cycles)
+        start = batch.cycles.copy()
+        for _ in range(budget):
+            if not batch.step():
+                break
+
+        for i, reference in enumerate(references):
+            executed = int(batch.cycles[i] - start[i])
+            error = batch.errors.get(i) if executed else None
+
+            #the reference runs as many cycles, or until it raises too
+            expected_error = None
+            steps = 0
+            while steps < executed and not reference.halted:
+                try:
+                    reference.reference_step()
+                except (ValueError, IndexError) as e:
+                    expected_error = str(e)
+                    steps += 1
+                    break
+                steps += 1
+
+            where = f"batch lane {i} at cycle {cycles + steps}"
+            if i:
+                where += f" (registers {' '.join(f'R{r}={value:02X}' for r, value in enumerate(registers[i]))})"
+            if error != expected_error:
+                return f"{where}: error {expected_error} != {error}"
+            if executed != steps:
+                return f"{where}: ran {executed} cycles, the reference ran {steps}"
+            if executed < budget and not reference.halted:
+                return f"{where}: ran {executed} cycles of a {budget} cycle budget"
+            difference = compare(reference, Lane(batch, i))
+            if difference is not None:
+                return f"{where}: {difference}"
+        cycles += budget
+    return None
+
+
+def check(case, engine):
+    #runs case on the reference and on engine, returns the first disagreement as
+    #a message, None if they agree all the way
+    if engine == "batch":
+        return check_batch(case)
+    run = ENGINES[engine]
+    rng = random.Random(case.seed)
+    reference = case.cpu()
+    cpu = case.cpu()
+
+    cycles = 0
+    while cycles < case.max_cycles and not reference.halted:
+        budget = min(rng.choice(BUDGETS), case.max_cycles - cycles)
+        try:
+            executed = run(cpu, budget)
+            error = None
+        except (ValueError, IndexError) as e:
+            executed = None
+            error = f"{type(e).__name__}: {e}"
+
+        #the reference runs as many cycles, or until it raises too
+        expected_error = None
+        steps = 0
+        while steps < (budget if executed is None else executed) and not reference.halted:
+            try:
+                reference.reference_step()
+            except (ValueError, IndexError) as e:
+                expected_error = f"{type(e).__name__}: {e}"
+                break
+            steps += 1
+
+        where = f"{engine} at cycle {cycles + steps}"
+        if error != expected_error:
+            return f"{where}: error {expected_error} != {error}"
+        if executed is not None and executed != steps:
+            return f"{where}: ran {executed} cycles, the reference ran {steps}"
+        if executed is not None and (executed > budget or executed < budget and not cpu.halted):
+            return f"{where}: ran {executed} cycles of a {budget} cycle budget"
+        difference = compare(reference, cpu)
+        if difference is not None:
+            return f"{where}: {difference}"
+        if error is not None:
+            break
+        cycles += steps
+    return None
+
+
+def remove_op(case, index):
+    #case without ops[index], jumps to it go to the op after it instead
+    ops = []
+    for i, (instruction, args) in enumerate(case.ops):
+        if i == index:
+            continue
+        if ADDR in instruction.operands:
+            target = args[0]
+            args = (target - 1 if target > index else target,)
+        ops.append((instruction, args))
+    return case.replace(ops=ops)
+
+
+def simpler(case):
+    #candidate cases one step simpler than case, most reducing first
+    for index in range(len(case.ops) - 1, -1, -1):
+        yield remove_op(case, index)
+    if case.memory:
+        yield case.replace(memory={})
+        for addr in case.memory:
+            yield case.replace(memory={a: v for a, v in case.memory.items() if a != addr})
+    for r, value in enumerate(case.registers):
+        if value:
+            registers = list(case.registers)
+            registers[r] = 0
+            yield case.replace(registers=registers)
+    for index, (instruction, args) in enumerate(case.ops):
+        for slot, kind in enumerate(instruction.operands):
+            if kind in (IMM, REG, REG2) and args[slot]:
+                ops = list(case.ops)
+                ops[index] = (instruction, args[:slot] + (0,) + args[slot + 1:])
+                yield case.replace(ops=ops)
+    for seed in range(min(case.seed, 4)):
+        #other budget sequences, the smallest seeds first
+        yield case.replace(seed=seed)
+
+
+def shrink(case, engine, message):
+    #the simplest case found that still fails on engine, and its message
+    tries = 0
+    progress = True
+    while progress and tries < MAX_SHRINK_TRIES:
+        progress = False
+        for candidate in simpler(case):
+            tries += 1
+            result = check(candidate, engine)
+            if result is not None:
+                case, message = candidate, result
+                progress = True
+                break
+            if tries >= MAX_SHRINK_TRIES:
+                break
+    return case, message
+
+
+class Failure:
+    def __init__(self, engine, seed, message, case):
+        self.engine = engine
+        self.seed = seed        #of the case as generated, before shrinking
+        self.message = message  #of the shrunk case
+        self.case = case
+
+    def __repr__(self):
+        return f"Failure({self.engine} seed={self.seed}: {self.message})"
+
+
+def check_seeds(seeds, engines, max_cycles=DEFAULT_MAX_CYCLES, shrink_cases=True):
+    #failures of the cases generated from seeds, at most one per seed and engine
+    failures = []
+    for seed in seeds:
+        case = random_case(seed, max_cycles)
+        for engine in engines:
+            message = check(case, engine)
+            if message is not None:
+                failing = case
+                if shrink_cases:
+                    failing, message = shrink(case, engine, message)
+                failures.append(Failure(engine, seed, message, failing))
+    return failures
+
+
+def run_cases(seeds, engines=None, workers=None, max_cycles=DEFAULT_MAX_CYCLES, batch=DEFAULT_BATCH, shrink_cases=True):
+    #check_seeds across a process pool, failures in no particular order
+    engines = DEFAULT_ENGINES if engines is None else list(engines)
+    seeds = list(seeds)
+    batches = [seeds[i:i + batch] for i in range(0, len(seeds), batch)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [failure for seeds in batches for failure in check_seeds(seeds, engines, max_cycles, shrink_cases)]
+
+    #imported here, like runner.run_jobs, workers only need check_seeds
+    from concurrent.futures import ProcessPoolExecutor
+
+    failures = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(check_seeds, seeds, engines, max_cycles, shrink_cases) for seeds in batches]
+        for future in futures:
+            failures.extend(future.result())
+    return failures
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Differential testing of the CPU8Bit engines against the reference interpreter")
+    parser.add_argument("--cases", type=int, default=1000, help="random programs to generate")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first case")
+    parser.add_argument("--engines", nargs="+", choices=ENGINE_NAMES, default=DEFAULT_ENGINES)
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-cycles", type=int, default=DEFAULT_MAX_CYCLES, help="cycle budget per case")
+    parser.add_argument("--no-shrink", action="store_true", help="report failing cases as generated")
+    args = parser.parse_args(argv)
+
+    seeds = range(args.seed, args.seed + args.cases)
+    failures = run_cases(seeds, args.engines, args.workers, args.max_cycles, shrink_cases=not args.no_shrink)
+    for failure in sorted(failures, key=lambda failure: (failure.seed, failure.engine)):
+        print(f"seed {failure.seed}, {failure.message}")
+        print(failure.case.source())
+        print(json.dumps(failure.case.job()))
+        print()
+    print(f"{args.cases} cases on {', '.join(args.engines)}: {len(failures)} failures")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
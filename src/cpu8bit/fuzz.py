@@ -0,0 +1,336 @@
+'''
+Coverage guided fuzzing of CPU8Bit programs.
+
+An input is the initial registers and a set of memory bytes written over the
+program before it runs. The Fuzzer mutates inputs from its corpus, runs them
+on worker processes with a cover.Coverage bitmap, and keeps each input that
+reaches a PC or branch edge no earlier input did. Inputs that make an
+instruction raise, an invalid opcode or register, are kept as crashes, one
+per message and PC:
+
+    fuzzer = Fuzzer(segments, ranges=[(0x2000, 0x2100)], max_cycles=10000)
+    fuzzer.run(1_000_000, workers=8)
+    for (message, pc), fuzz_input in fuzzer.crashes.items():
+        print(f"{pc:04X} {message}", input_job("program.asm", fuzz_input))
+
+Workers load the program once and take a snapshot of it, every execution
+restores that snapshot, which only copies back the pages the last one wrote,
+so compiled blocks stay cached between executions unless an input changes
+code. Memory is only mutated inside `ranges`, all memory outside the
+program's segments by default, and the segments too with mutate_code.
+Running out of cycles is counted as a hang, not a crash.
+
+Crashes and the corpus can be written as runner jobs, so any of them can be
+replayed with `cpu8 jobs crashes.jsonl`.
+
+    cpu8 fuzz program.asm --executions 1000000 --range 0x2000:0x2100 --crashes crashes.jsonl
+'''
+
+import os
+import random
+import sys
+import time
+
+from .cover import Coverage
+from .cpu import PAGE_SIZE, CPU8Bit
+
+#executions per task sent to a worker
+DEFAULT_BATCH = 500
+
+#most memory bytes an input writes
+MAX_PATCHES = 64
+
+#values that tend to find edge cases
+INTERESTING = (0x00, 0x01, 0x02, 0x0F, 0x10, 0x7F, 0x80, 0x81, 0xFE, 0xFF)
+
+#corpus inputs sent with each task: the newest ones, and a sample of the rest
+RECENT = 16
+SAMPLE = 48
+
+MAX_CYCLES_MESSAGE = "Max cpu cycles exceeded"
+
+#per worker process, set by init_worker
+target = None
+
+
+class Target:
+    #a loaded program and its snapshot, runs one input at a time
+    def __init__(self, segments, entry=0, ranges=(), max_cycles=10000):
+        self.cpu = CPU8Bit()
+        self.cpu.load_segments(segments)
+        self.cpu.PC = entry
+        self.base = self.cpu.snapshot()
+        self.image = self.base.memory()
+        self.ranges = ranges
+        self.size = sum(end - start for start, end in ranges)
+        self.max_cycles = max_cycles
+
+    def execute(self, fuzz_input):
+        #(coverage, error message or None)
+        registers, patches = fuzz_input
+        cpu = self.cpu
+        cpu.restore(self.base)
+        cpu.reg = list(registers)
+
+        mem = cpu.mem
+        dirty = cpu.dirty_pages
+        code_addrs = cpu.code_addrs
+        for addr, value in patches:
+            mem[addr] = value
+            dirty.add(addr // PAGE_SIZE)
+            if addr in code_addrs:
+                cpu.invalidate_code(addr)
+
+        coverage = Coverage()
+        try:
+            coverage.run(cpu, self.max_cycles)
+        except (ValueError, IndexError) as e:
+            return coverage, str(e)
+        return coverage, None
+
+    def pick_addr(self, rng):
+        #uniform over the mutable ranges
+        offset = rng.randrange(self.size)
+        for start, end in self.ranges:
+            if offset < end - start:
+                return start + offset
+            offset -= end - start
+        raise AssertionError("offset past the mutable ranges")
+
+    def mutate(self, rng, fuzz_input):
+        registers, patches = fuzz_input
+        registers = list(registers)
+        patches = dict(patches)
+
+        for _ in range(rng.choice((1, 1, 1, 2, 4))):
+            kind = rng.randrange(8 if self.size else 3)
+            if kind < 3:
+                r = rng.randrange(4)
+                if kind == 0:
+                    registers[r] = rng.choice(INTERESTING) if rng.randrange(2) else rng.randrange(256)
+                elif kind == 1:
+                    registers[r] ^= 1 << rng.randrange(8)
+                else:
+                    registers[r] = (registers[r] + rng.choice((1, -1, 2, -2, 16, -16))) & 0xFF
+                continue
+
+            if kind == 7 and patches:
+                del patches[rng.choice(list(patches))]
+                continue
+
+            addr = self.pick_addr(rng)
+            value = patches.get(addr, self.image[addr])
+            if kind == 3:
+                value = rng.randrange(256)
+            elif kind == 4:
+                value ^= 1 << rng.randrange(8)
+            elif kind == 5:
+                value = (value + rng.choice((1, -1, 2, -2, 16, -16))) & 0xFF
+            else:
+                value = rng.choice(INTERESTING)
+            patches[addr] = value
+
+        while len(patches) > MAX_PATCHES:
+            del patches[rng.choice(list(patches))]
+        return tuple(registers), tuple(sorted(patches.items()))
+
+
+def run_batch(fuzz_target, corpus, seen, seed, count):
+    #mutates and runs count inputs, returns the ones with coverage not in seen
+    #(with their coverage), new crashes and how many runs hung
+    rng = random.Random(seed)
+    seen = Coverage.from_bytes(seen)
+    found = []
+    crashes = []
+    crashed = set()
+    hangs = 0
+    for _ in range(count):
+        fuzz_input = fuzz_target.mutate(rng, rng.choice(corpus))
+        coverage, error = fuzz_target.execute(fuzz_input)
+        if error == MAX_CYCLES_MESSAGE:
+            hangs += 1
+        elif error is not None:
+            key = (error, coverage.error_pc)
+            if key not in crashed:
+                crashed.add(key)
+                crashes.append((key, fuzz_input))
+        if seen.merge(coverage):
+            found.append((fuzz_input, coverage.to_bytes()))
+    return found, crashes, hangs
+
+
+def init_worker(segments, entry, ranges, max_cycles):
+    global target
+    target = Target(segments, entry, ranges, max_cycles)
+
+
+def worker_batch(corpus, seen, seed, count):
+    return run_batch(target, corpus, seen, seed, count)
+
+
+def fuzz_ranges(segments, ranges=None, mutate_code=False, size=65536):
+    #merged (start, end) ranges memory is mutated in
+    code = [(origin, origin + len(data)) for origin, data in segments if len(data)]
+    if ranges is None:
+        #everything outside the program
+        ranges = []
+        pos = 0
+        for start, end in sorted(code):
+            if start > pos:
+                ranges.append((pos, start))
+            pos = max(pos, end)
+        if pos < size:
+            ranges.append((pos, size))
+    ranges = list(ranges) + (code if mutate_code else [])
+
+    merged = []
+    for start, end in sorted(ranges):
+        if not (0 <= start < end <= size):
+            raise ValueError(f"Bad fuzz range {start:#x}-{end:#x}")
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class Fuzzer:
+    def __init__(self, segments, entry=0, ranges=None, mutate_code=False, max_cycles=10000, seed=None):
+        #segments are copied, memoryviews of an object file cannot go to workers
+        self.segments = [(origin, bytes(data)) for origin, data in segments]
+        self.entry = entry
+        self.ranges = fuzz_ranges(self.segments, ranges, mutate_code)
+        self.max_cycles = max_cycles
+        self.rng = random.Random(seed)
+
+        self.coverage = Coverage()
+        self.corpus = [((0, 0, 0, 0), ())]
+        self.crashes = {}       #(message, PC) -> first input found
+        self.executions = 0
+        self.hangs = 0
+
+    def target(self):
+        return Target(self.segments, self.entry, self.ranges, self.max_cycles)
+
+    def run(self, executions, workers=None, batch=DEFAULT_BATCH):
+        #runs about `executions` more inputs, in batches, on `workers`
+        #processes or in this one with workers=1
+        if self.executions == 0:
+            fuzz_target = self.target()
+            for fuzz_input in self.corpus:
+                coverage, error = fuzz_target.execute(fuzz_input)
+                self.add_results(([(fuzz_input, coverage.to_bytes())], [], 0), 1)
+                if error is not None and error != MAX_CYCLES_MESSAGE:
+                    self.crashes.setdefault((error, coverage.error_pc), fuzz_input)
+
+        workers = workers or os.cpu_count() or 1
+        counts = [batch] * (executions // batch) + ([executions % batch] if executions % batch else [])
+        if workers == 1:
+            fuzz_target = self.target()
+            for count in counts:
+                self.add_results(run_batch(fuzz_target, *self.task(count)), count)
+            return
+
+        #imported here, like runner.run_jobs, workers only need the module itself
+        from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+        initargs = (self.segments, self.entry, self.ranges, self.max_cycles)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=initargs) as pool:
+            pending = {}
+            while counts or pending:
+                while counts and len(pending) < workers * 2:
+                    count = counts.pop()
+                    pending[pool.submit(worker_batch, *self.task(count))] = count
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.add_results(future.result(), pending.pop(future))
+
+    def task(self, count):
+        #(corpus, seen, seed, count) for run_batch
+        corpus = self.corpus
+        if len(corpus) > RECENT + SAMPLE:
+            corpus = corpus[-RECENT:] + self.rng.sample(corpus[:-RECENT], SAMPLE)
+        return corpus, self.coverage.to_bytes(), self.rng.getrandbits(64), count
+
+    def add_results(self, results, count):
+        found, crashes, hangs = results
+        for fuzz_input, coverage in found:
+            #other batches may have found the same bits since
+            if self.coverage.merge(Coverage.from_bytes(coverage)):
+                self.corpus.append(fuzz_input)
+        for key, fuzz_input in crashes:
+            self.crashes.setdefault(key, fuzz_input)
+        self.executions += count
+        self.hangs += hangs
+
+
+def input_job(program, fuzz_input, max_cycles=10000):
+    #runner job replaying an input, runs of adjacent bytes become one patch
+    registers, patches = fuzz_input
+    memory = {}
+    start = None
+    run = bytearray()
+    for addr, value in patches:
+        if start is not None and addr == start + len(run):
+            run.append(value)
+            continue
+        if start is not None:
+            memory[f"0x{start:04X}"] = run.hex()
+        start, run = addr, bytearray((value,))
+    if start is not None:
+        memory[f"0x{start:04X}"] = run.hex()
+    return {"program": program, "registers": list(registers), "memory": memory, "max_cycles": max_cycles}
+
+
+def parse_range(text):
+    #"start:end"
+    start, _, end = text.partition(":")
+    return int(start, 0), int(end, 0)
+
+
+def write_jobs(path, jobs):
+    import json
+
+    with open(path, "w", encoding="utf-8") as f:
+        for job in jobs:
+            f.write(json.dumps(job) + "\n")
+
+
+def main(argv=None):
+    import argparse
+
+    from .cli import load
+
+    parser = argparse.ArgumentParser(description="Coverage guided fuzzing of a CPU8Bit program")
+    parser.add_argument("program", help=".asm or .c8o program")
+    parser.add_argument("--executions", type=int, default=100000)
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-cycles", type=int, default=10000, help="cycle budget per execution")
+    parser.add_argument("--range", type=parse_range, action="append", dest="ranges", help="memory start:end to mutate (default: all memory outside the program)")
+    parser.add_argument("--mutate-code", action="store_true", help="also mutate the program's own bytes")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--crashes", help="write crashing inputs as runner jobs to this .jsonl file")
+    parser.add_argument("--corpus", help="write the corpus as runner jobs to this .jsonl file")
+    args = parser.parse_args(argv)
+
+    segments, _, entry = load(args.program)
+    fuzzer = Fuzzer(segments, entry, args.ranges, args.mutate_code, args.max_cycles, args.seed)
+    start = time.perf_counter()
+    fuzzer.run(args.executions, args.workers)
+    seconds = time.perf_counter() - start
+
+    pcs, edges = fuzzer.coverage.count()
+    print(f"{fuzzer.executions} executions in {seconds:.1f}s ({fuzzer.executions / seconds:.0f}/s), {fuzzer.hangs} hangs")
+    print(f"coverage: {pcs} PCs, {edges} branch edges, corpus {len(fuzzer.corpus)}")
+    for (message, pc), fuzz_input in sorted(fuzzer.crashes.items(), key=lambda item: item[0][1]):
+        print(f"crash {pc:04X}: {message}")
+
+    if args.crashes:
+        write_jobs(args.crashes, [input_job(args.program, fuzz_input, args.max_cycles) for fuzz_input in fuzzer.crashes.values()])
+    if args.corpus:
+        write_jobs(args.corpus, [input_job(args.program, fuzz_input, args.max_cycles) for fuzz_input in fuzzer.corpus])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+'''
+Instruction set of the CPU8Bit, in one place.
+
+The assembler encodes through this table and CPU8Bit / BatchCPU decode
+through it, so a new instruction or operand form only has to be added here
+(plus its handlers).
+'''
+
+#operand kinds, in source order
+REG = "reg"             #register id in the low nibble of the opcode
+IMM = "imm"             #immediate byte, #n
+REG2 = "reg2"           #register id in the low nibble of the operand byte
+MEM = "mem"             #16 bit address in [brackets], little-endian
+ADDR = "addr"           #16 bit address without brackets, little-endian
+REG_PAIR = "reg_pair"   #[R1:R2], R1 in the high nibble and R2 in the low nibble of the operand byte
+
+OPERAND_BYTES = {REG: 0, IMM: 1, REG2: 1, MEM: 2, ADDR: 2, REG_PAIR: 1}
+
+
+class Instruction:
+    def __init__(self, mnemonic, operands, opcode, name, reg2_error="Invalid register in operand"):
+        self.mnemonic = mnemonic
+        self.operands = operands
+        self.opcode = opcode        #base opcode, the register is added for REG forms
+        self.name = name            #CPU8Bit handlers are op_<name> and handle_<name>
+        self.length = 1 + sum(OPERAND_BYTES[kind] for kind in operands)
+        self.family = REG in operands
+        self.reg2_error = reg2_error
+
+        #(source token index, kind) per operand, and the slots that tell
+        #operand forms of the same mnemonic apart
+        self.operand_slots = tuple(enumerate(operands, 1))
+        self.choice = tuple((idx, kind) for idx, kind in self.operand_slots if kind in (IMM, REG2))
+
+
+INSTRUCTIONS = [
+    Instruction("NOP", (), 0x00, "nop"),
+    Instruction("LDI", (REG, IMM), 0x10, "ldi"),
+    Instruction("LD", (REG, MEM), 0x20, "ld"),
+    Instruction("ST", (REG, MEM), 0x30, "st"),
+    Instruction("ADD", (REG, IMM), 0x40, "add_imm"),
+    Instruction("ADD", (REG, REG2), 0x50, "add_reg", reg2_error="Invalid register2"),
+    Instruction("SUB", (REG, IMM), 0x60, "sub_imm"),
+    Instruction("AND", (REG, IMM), 0x70, "and_imm"),
+    Instruction("OR", (REG, IMM), 0x80, "or_imm"),
+    Instruction("XOR", (REG, IMM), 0x90, "xor_imm"),
+    Instruction("JMP", (ADDR,), 0xA0, "jmp"),
+    Instruction("JZ", (ADDR,), 0xA1, "jz"),
+    Instruction("JNZ", (ADDR,), 0xA2, "jnz"),
+    Instruction("MOV", (REG, REG2), 0xB0, "mov_reg"),
+    Instruction("LDX", (REG, REG_PAIR), 0xC0, "ldx_regs"),
+    Instruction("STX", (REG, REG_PAIR), 0xD0, "stx_regs"),
+    Instruction("HLT", (), 0xFF, "hlt"),
+]
+
+#mnemonic -> operand forms, tried in order
+MNEMONICS = {}
+for instruction in INSTRUCTIONS:
+    MNEMONICS.setdefault(instruction.mnemonic, []).append(instruction)
+
+#opcode byte -> Instruction, None for undefined opcodes and register ids above 3
+OPCODES = [None] * 256
+
+#opcode byte -> bytes fetched by the CPU, also for invalid opcodes, which are
+#fetched with the length of their high-nibble family or as 2 bytes
+FETCH_LENGTH = [2] * 256
+
+#high nibbles that hold a register family
+FAMILIES = {}
+
+for instruction in INSTRUCTIONS:
+    if instruction.family:
+        FAMILIES[instruction.opcode] = instruction
+        for r in range(16):
+            FETCH_LENGTH[instruction.opcode + r] = instruction.length
+        for r in range(4):
+            OPCODES[instruction.opcode + r] = instruction
+    else:
+        FETCH_LENGTH[instruction.opcode] = instruction.length
+        OPCODES[instruction.opcode] = instruction
+
+
+def opcode_error(opcode):
+    #message CPU8Bit raises for an opcode with no Instruction
+    if opcode & 0xF0 in FAMILIES:
+        return f"Invalid register in opcode {opcode:02X}"
+    return f"Unknown opcode {opcode:02X}"
+
+
+def instruction_len(mnemonic):
+    forms = MNEMONICS.get(mnemonic.upper())
+    return forms[0].length if forms else 0
@@ -0,0 +1,165 @@
+'''
+Binary object files for assembled programs.
+
+An object file holds the non-empty segments of a program, its labels and an
+entry point, so a run does not have to assemble anything:
+
+    magic "C8OB" | u16 format | u16 entry | u16 segment count | u32 label count
+    | (u16 origin, u32 offset, u32 length) * segment count
+    | (u16 name length, utf-8 name, u16 position) * label count
+    | segment bytes
+
+Offsets are from the start of the file. load_object() memory-maps the file
+and returns the segments as memoryviews of the mapping, so nothing is read
+or copied until CPU8Bit.load_segments() copies them into memory. Labels are
+only decoded when asked for.
+
+    cpu8 asm programs/fibonacci.asm -o fibonacci.c8o --entry loop
+
+    with load_object("fibonacci.c8o") as obj:
+        obj.load(cpu)
+'''
+
+import mmap
+import os
+import struct
+import sys
+
+from .asmcache import write_atomic
+from .assembler import assemble_segments
+from .peephole import format_report
+
+MAGIC = b"C8OB"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<4sHHHI")
+SEGMENT = struct.Struct("<HII")
+NAME_LENGTH = struct.Struct("<H")
+POSITION = struct.Struct("<H")
+
+
+def encode_object(segments: list[tuple[int, bytes]], labels: dict[str, int], entry: int = 0) -> bytes:
+    table = []
+    for name, pos in labels.items():
+        encoded = name.encode("utf-8")
+        table.append(NAME_LENGTH.pack(len(encoded)) + encoded + POSITION.pack(pos))
+    table = b"".join(table)
+
+    offset = HEADER.size + SEGMENT.size * len(segments) + len(table)
+    out = [HEADER.pack(MAGIC, FORMAT_VERSION, entry, len(segments), len(labels))]
+    for origin, data in segments:
+        out.append(SEGMENT.pack(origin, offset, len(data)))
+        offset += len(data)
+    out.append(table)
+    out.extend(bytes(data) for _, data in segments)
+    return b"".join(out)
+
+
+def write_object(path: str, segments: list[tuple[int, bytes]], labels: dict[str, int], entry: int = 0) -> None:
+    write_atomic(path, encode_object(segments, labels, entry))
+
+
+class ObjectFile:
+    #a mapped object file, segments stay valid until close()
+    def __init__(self, data) -> None:
+        view = memoryview(data)
+        if len(view) < HEADER.size or bytes(view[:4]) != MAGIC:
+            raise ValueError("Not a CPU8Bit object file")
+        magic, version, self.entry, segment_count, self.label_count = HEADER.unpack_from(view)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported object file format {version}")
+
+        self.data = data
+        self.view = view
+        self.segments = []
+        for i in range(segment_count):
+            origin, offset, length = SEGMENT.unpack_from(view, HEADER.size + i * SEGMENT.size)
+            if offset + length > len(view):
+                raise ValueError("Object file is truncated")
+            self.segments.append((origin, view[offset:offset + length]))
+        self.labels_offset = HEADER.size + SEGMENT.size * segment_count
+        self._labels = None
+
+    @property
+    def labels(self) -> dict[str, int]:
+        if self._labels is None:
+            labels = {}
+            view = self.view
+            pos = self.labels_offset
+            for _ in range(self.label_count):
+                (name_len,) = NAME_LENGTH.unpack_from(view, pos)
+                pos += NAME_LENGTH.size
+                name = bytes(view[pos:pos + name_len]).decode("utf-8")
+                pos += name_len
+                (labels[name],) = POSITION.unpack_from(view, pos)
+                pos += POSITION.size
+            self._labels = labels
+        return self._labels
+
+    def load(self, cpu) -> None:
+        cpu.load_segments(self.segments)
+        cpu.PC = self.entry
+
+    def close(self) -> None:
+        #the mapping can only be closed once no view of it is left
+        for _, segment in self.segments:
+            segment.release()
+        self.segments = []
+        self.view.release()
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self) -> "ObjectFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def load_object(path: str) -> ObjectFile:
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            #an empty file cannot be mapped
+            data = f.read()
+    return ObjectFile(data)
+
+
+def parse_entry(value: str, labels: dict[str, int]) -> int:
+    if value in labels:
+        return labels[value]
+    try:
+        entry = int(value, 0)
+    except ValueError:
+        raise ValueError(f"Entry is not a label or address: {value!r}")
+    if not (0 <= entry <= 0xFFFF):
+        raise ValueError(f"Entry out of range {entry:#x}")
+    return entry
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Assemble a CPU8Bit program into an object file")
+    parser.add_argument("program", help=".asm program to assemble")
+    parser.add_argument("-o", "--output", help="object file to write (default: program with .c8o)")
+    parser.add_argument("--entry", default="0", help="label or address execution starts at")
+    parser.add_argument("--optimize", action="store_true", help="run the peephole optimizer")
+    args = parser.parse_args(argv)
+
+    report = []
+    with open(args.program, "r", encoding="utf-8") as f:
+        segments, label_table = assemble_segments(f, args.optimize, report)
+    labels = dict(label_table.items())
+    entry = parse_entry(args.entry, labels)
+
+    output = args.output or os.path.splitext(args.program)[0] + ".c8o"
+    write_object(output, segments, labels, entry)
+    if report:
+        print(format_report(report), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
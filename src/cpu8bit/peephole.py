@@ -0,0 +1,379 @@
+'''
+Peephole optimizer for the assembler.
+
+Runs on the tokenized source lines before they are encoded, so labels simply
+land on the new addresses when code shrinks. Rewrites, repeated until none
+applies:
+
+    NOP                                 removed
+    JMP / JZ / JNZ label                retargeted past labels that hold a JMP,
+                                        removed if label is the next instruction
+    LDI r, #0 / ADD r, r2               MOV r, r2           (if C is not read later)
+    LDI r, #0 / ADD r, #n               LDI r, #n           (if C is not read later)
+    MOV r, r                            removed             (if Z is not read later)
+    LDI / LD / LDX / MOV r followed by
+    an instruction loading r again      first one removed
+    ST r, [a] / ST r2, [a]              first one removed
+    LD r, [a] / ST r, [a]               ST removed
+    ST r, [a] / LD r, [a]               LD removed          (if Z is not read later)
+
+Only straight-line code is looked at: two instructions are a pair only with
+no label or directive between them, and a flag counts as read if anything
+could see it before it is written again, including a jump, HLT or the end of
+the source. C is never tested by an instruction, but it is part of the state
+left behind at HLT.
+
+An .org run whose code is referenced by a numeric address, by label+offset,
+or by a label on an instruction that is read or written as data (an LD / ST
+operand or a .WORD, which is how LDX / STX get at it), is left untouched,
+since its bytes and layout must not change. Labels on .BYTE / .WORD data move
+with the data, so reading them needs no such care. Code read or written
+through addresses computed any other way is not detected, do not optimize
+such programs.
+
+MAR is kept too: a load is only removed if MAR is written again before
+anything could see it. A retargeted or removed jump does leave a different
+MAR behind, it holds the jump address.
+'''
+
+from .isa import IMM, MEM, MNEMONICS, REG, REG2, REG_PAIR
+
+#flags written / read per instruction name
+Z_FLAG = 1
+C_FLAG = 2
+
+WRITES = {
+    "ldi": Z_FLAG, "ld": Z_FLAG, "ldx_regs": Z_FLAG, "mov_reg": Z_FLAG,
+    "add_imm": Z_FLAG | C_FLAG, "add_reg": Z_FLAG | C_FLAG, "sub_imm": Z_FLAG | C_FLAG,
+    "and_imm": Z_FLAG, "or_imm": Z_FLAG, "xor_imm": Z_FLAG,
+}
+READS = {"jz": Z_FLAG, "jnz": Z_FLAG}
+
+JUMPS = ("jmp", "jz", "jnz")
+
+#instructions whose only effect is loading a register and setting Z from it
+LOADS = ("ldi", "ld", "ldx_regs", "mov_reg")
+
+
+class Line:
+    #one source line with tokens, instructions are parsed into their operands
+    def __init__(self, number, raw, parts):
+        self.number = number
+        self.raw = raw
+        self.parts = parts
+        self.removed = False
+        self.parse()
+
+    def parse(self):
+        self.instruction = None     #None for labels, directives and anything malformed
+        self.name = None
+        self.reg = self.reg2 = self.imm = self.addr = self.pair = None
+
+        forms = MNEMONICS.get(self.parts[0].upper())
+        if forms is None:
+            return
+        instruction = forms[0]
+        if len(forms) > 1 and len(self.parts) > instruction.choice[0][0]:
+            kind = REG2 if self.parts[instruction.choice[0][0]].upper().startswith("R") else IMM
+            instruction = next(form for form in forms if form.choice[0][1] == kind)
+
+        try:
+            for idx, kind in instruction.operand_slots:
+                token = self.parts[idx]
+                if kind == REG:
+                    self.reg = parse_reg(token)
+                elif kind == REG2:
+                    self.reg2 = parse_reg(token)
+                elif kind == IMM:
+                    self.imm = int(token[1:] if token.startswith("#") else token, 0) & 0xFF
+                elif kind == REG_PAIR:
+                    hi, lo = token.upper().strip("[]").split(":")
+                    self.pair = (parse_reg(hi), parse_reg(lo))
+                else: #MEM / ADDR
+                    self.addr = token.strip("[]").replace(" ", "")
+        except (IndexError, ValueError):
+            #left as is, the assembler reports it
+            return
+        self.instruction = instruction
+        self.name = instruction.name
+
+    def label(self):
+        if self.instruction is None and self.parts[0].endswith(":") and not self.parts[0].startswith("."):
+            return self.parts[0][:-1]
+        return None
+
+    def rewrite(self, parts):
+        self.parts = parts
+        self.parse()
+
+    def text(self):
+        return f"{self.parts[0]} {', '.join(self.parts[1:])}".rstrip()
+
+
+def parse_reg(token):
+    token = token.upper()
+    if not token.startswith("R") or not token[1:].isdigit() or int(token[1:]) > 3:
+        raise ValueError(token)
+    return int(token[1:])
+
+
+def parse_number(token):
+    try:
+        return int(token, 0)
+    except ValueError:
+        return None
+
+
+def optimize_lines(lines, report=None):
+    #lines are (line number, raw line, tokens) of the non-empty source lines,
+    #returns them rewritten, with (line number, before, after) appended to report
+    lines = [Line(number, raw, parts) for number, raw, parts in lines]
+    frozen = frozen_lines(lines)
+    optimizer = Optimizer(lines, frozen, report)
+    while optimizer.run_pass():
+        pass
+    return [(line.number, line.raw, line.parts) for line in optimizer.lines]
+
+
+def frozen_lines(lines):
+    #ids of the lines in .org runs that are referenced by absolute position,
+    #or whose code is read or written as data through a label
+    regions = []            #[start, end, lines] per .org run
+    labels = {}
+    code_labels = set()     #labels on an instruction
+    pending = []            #labels not followed by anything yet
+    pos = 0
+    region = [0, 0, []]
+    regions.append(region)
+    for line in lines:
+        head = line.parts[0].upper()
+        if line.instruction is not None:
+            pos += line.instruction.length
+            code_labels.update(pending)
+            pending = []
+        elif line.label() is not None:
+            labels[line.label()] = pos
+            pending.append(line.label())
+        else:
+            pending = []
+        if head == ".ORG":
+            pos = parse_number(line.parts[1]) if len(line.parts) > 1 else None
+            if pos is None:
+                #the assembler rejects it, do not touch anything
+                return set(id(line) for line in lines)
+            region = [pos, pos, []]
+            regions.append(region)
+        elif head == ".BYTE":
+            pos += len(line.parts) - 1
+        elif head == ".WORD":
+            pos += 2
+        region[1] = pos
+        region[2].append(line)
+
+    targets = []
+    for line in lines:
+        if line.addr is not None:
+            token = line.addr
+            data = MEM in line.instruction.operands
+        elif line.parts[0].upper() == ".WORD" and len(line.parts) > 1:
+            token = line.parts[1].replace(" ", "")
+            data = True
+        else:
+            continue
+        if data and token in code_labels:
+            targets.append(labels[token])
+            continue
+        addr = parse_number(token)
+        if addr is None and "+" in token:
+            label, offset = token.split("+", 1)
+            if label in labels and parse_number(offset):
+                addr = labels[label] + parse_number(offset)
+        if addr is not None:
+            targets.append(addr)
+
+    frozen = set()
+    for start, end, region_lines in regions:
+        if any(start <= addr < end for addr in targets):
+            frozen.update(id(line) for line in region_lines)
+    return frozen
+
+
+class Optimizer:
+    def __init__(self, lines, frozen, report):
+        self.lines = lines
+        self.frozen = frozen
+        self.report = report
+
+    def record(self, lines, after):
+        if self.report is not None:
+            before = " / ".join(line.text() for line in lines)
+            self.report.append((lines[0].number, before, after))
+
+    def remove(self, line):
+        self.record([line], "removed")
+        line.removed = True
+
+    def run_pass(self):
+        #one sweep over the lines, returns whether anything changed
+        lines = self.lines
+        labels = {line.label(): i for i, line in enumerate(lines) if line.label() is not None}
+        changed = False
+
+        for i, line in enumerate(lines):
+            if line.removed or line.instruction is None or id(line) in self.frozen:
+                continue
+            name = line.name
+
+            if name == "nop":
+                self.remove(line)
+                changed = True
+                continue
+
+            if name in JUMPS and line.addr in labels:
+                target = self.thread(line.addr, labels)
+                if target != line.addr:
+                    before = line.text()
+                    line.rewrite([line.parts[0], target])
+                    if self.report is not None:
+                        self.report.append((line.number, before, line.text()))
+                    changed = True
+                if self.falls_to(i, line.addr):
+                    self.remove(line)
+                    changed = True
+                    continue
+
+            j = self.next_in_line(i)
+            if j is None:
+                continue
+            after = lines[j]
+            if self.rewrite_pair(i, line, j, after):
+                changed = True
+
+        self.lines = [line for line in lines if not line.removed]
+        return changed
+
+    def rewrite_pair(self, i, line, j, after):
+        name = line.name
+        other = after.name
+
+        if name == "ldi" and line.imm == 0 and after.reg == line.reg and not self.flags_read(j, C_FLAG):
+            if other == "add_reg" and after.reg2 != line.reg:
+                self.record([line, after], f"MOV R{line.reg}, R{after.reg2}")
+                line.rewrite(["MOV", f"R{line.reg}", f"R{after.reg2}"])
+                after.removed = True
+                return True
+            if other == "add_imm":
+                self.record([line, after], f"LDI R{line.reg}, #{after.imm}")
+                line.rewrite(["LDI", f"R{line.reg}", f"#{after.imm}"])
+                after.removed = True
+                return True
+
+        if name == "mov_reg" and line.reg == line.reg2 and not self.flags_read(i, Z_FLAG):
+            self.remove(line)
+            return True
+
+        if name in LOADS and other in LOADS and after.reg == line.reg and line.reg not in reads_of(after):
+            if name != "ld" or not self.mar_read(i):
+                self.remove(line)
+                return True
+
+        if name == "st" and other == "st" and after.addr == line.addr:
+            self.remove(line)
+            return True
+
+        if name == "ld" and other == "st" and after.addr == line.addr and after.reg == line.reg:
+            self.remove(after)
+            return True
+
+        if name == "st" and other == "ld" and after.addr == line.addr and after.reg == line.reg and not self.flags_read(j, Z_FLAG):
+            self.remove(after)
+            return True
+
+        return False
+
+    def next_in_line(self, i):
+        #index of the instruction straight after line i, None past a label or directive
+        lines = self.lines
+        for j in range(i + 1, len(lines)):
+            line = lines[j]
+            if line.removed:
+                continue
+            if line.instruction is None or id(line) in self.frozen:
+                return None
+            return j
+        return None
+
+    def target(self, label, labels):
+        #first instruction at label, None if it is data or a directive
+        lines = self.lines
+        for j in range(labels[label] + 1, len(lines)):
+            line = lines[j]
+            if line.removed or line.label() is not None:
+                continue
+            return line if line.instruction is not None else None
+        return None
+
+    def thread(self, label, labels):
+        #follows labels that hold a JMP to the final destination
+        seen = {label}
+        while label in labels:
+            line = self.target(label, labels)
+            if line is None or line.name != "jmp" or line.addr in seen:
+                break
+            label = line.addr
+            seen.add(label)
+        return label
+
+    def falls_to(self, i, label):
+        #whether label is reached by falling through from line i
+        lines = self.lines
+        for j in range(i + 1, len(lines)):
+            line = lines[j]
+            if line.removed:
+                continue
+            if line.label() is None:
+                return False
+            if line.label() == label:
+                return True
+        return False
+
+    def flags_read(self, i, flags):
+        #whether any of flags, as left by line i, can be seen by later code
+        for line in self.lines[i + 1:]:
+            if line.removed or line.label() is not None:
+                continue
+            if line.instruction is None:
+                return True
+            if READS.get(line.name, 0) & flags:
+                return True
+            flags &= ~WRITES.get(line.name, 0)
+            if not flags:
+                return False
+            if line.name in JUMPS or line.name == "hlt":
+                return True
+        return True
+
+
+    def mar_read(self, i):
+        #whether MAR, as left by line i, can be seen by later code
+        for line in self.lines[i + 1:]:
+            if line.removed or line.label() is not None:
+                continue
+            if line.instruction is None or line.name == "hlt":
+                return True
+            if line.instruction.length == 3:
+                return False
+        return True
+
+
+def reads_of(line):
+    #registers an instruction reads
+    if line.name == "mov_reg":
+        return (line.reg2,)
+    if line.name == "ldx_regs":
+        return line.pair
+    return ()
+
+
+def format_report(report):
+    return "\n".join(f"line {number}: {before} -> {after}" for number, before, after in report)
@@ -0,0 +1,212 @@
+'''
+Execution profiler for CPU8Bit.
+
+Profiler.run is a separate copy of the CPU8Bit.run loop that also counts
+executions per PC and per opcode, taken / not taken JZ and JNZ, and data
+reads / writes per address. CPU8Bit.run only hands over to it when a
+profiler is passed in, so unprofiled runs are unchanged.
+
+    profiler = Profiler()
+    cpu.run(max_cycles, profile=profiler)
+    print(profiler.report())
+
+Instruction fetches are not counted as memory reads, only LD / LDX / ST / STX
+data accesses are.
+'''
+
+import sys
+
+from .assembler import assemble
+from .cpu import CPU8Bit
+from .isa import OPCODES
+
+#what the profiler records for each opcode, from its instruction name
+NONE, READ_MAR, WRITE_MAR, READ_PAIR, WRITE_PAIR, JMP, JZ, JNZ = range(8)
+
+NAME_ACCESS = {
+    "ld": READ_MAR,
+    "st": WRITE_MAR,
+    "ldx_regs": READ_PAIR,
+    "stx_regs": WRITE_PAIR,
+    "jmp": JMP,
+    "jz": JZ,
+    "jnz": JNZ,
+}
+
+ACCESS = [NONE if instruction is None else NAME_ACCESS.get(instruction.name, NONE) for instruction in OPCODES]
+
+
+def opcode_name(opcode):
+    instruction = OPCODES[opcode]
+    if instruction is None:
+        return f"?{opcode:02X}"
+    if instruction.family:
+        return f"{instruction.mnemonic} R{opcode & 0x0F}"
+    return instruction.mnemonic
+
+
+class Profiler:
+    def __init__(self, memory_size=65536):
+        self.cycles = 0
+        self.pc_counts = [0] * 65536
+        self.opcode_counts = [0] * 256
+        self.reads = [0] * memory_size
+        self.writes = [0] * memory_size
+
+        #branch PC -> [taken, not taken], and (branch PC, target) -> taken count
+        self.branches = {}
+        self.edges = {}
+
+    def run(self, cpu, max_cycles=100000):
+        #CPU8Bit.run with counters, same results and errors
+        cache = cpu.decode_cache
+        decode = cpu.decode
+        pc_counts = self.pc_counts
+        opcode_counts = self.opcode_counts
+        reads = self.reads
+        writes = self.writes
+        branches = self.branches
+        edges = self.edges
+
+        cycles = 0
+        try:
+            while not cpu.halted and cycles < max_cycles:
+                pc = cpu.PC & 0xFFFF
+                entry = cache.get(pc)
+                if entry is None:
+                    entry = decode(pc)
+                handler, opcode, next_pc, mar, x, y, z = entry
+
+                pc_counts[pc] += 1
+                opcode_counts[opcode] += 1
+                access = ACCESS[opcode]
+                if access:
+                    if access == READ_PAIR or access == WRITE_PAIR:
+                        #y is None when the register pair is invalid, the handler raises
+                        if y is not None:
+                            reg = cpu.reg
+                            addr = (reg[y] << 8) + reg[z]
+                    elif access == JMP:
+                        edges[pc, mar] = edges.get((pc, mar), 0) + 1
+                    elif access == JZ or access == JNZ:
+                        taken = (cpu.z_result == 0) == (access == JZ)
+                        counts = branches.get(pc)
+                        if counts is None:
+                            counts = branches[pc] = [0, 0]
+                        if taken:
+                            counts[0] += 1
+                            edges[pc, mar] = edges.get((pc, mar), 0) + 1
+                        else:
+                            counts[1] += 1
+
+                cpu.IR = opcode
+                cpu.PC = next_pc
+                if mar is not None:
+                    cpu.MAR = mar
+                handler(x, y, z)
+                cycles += 1
+
+                #data accesses are counted once the instruction has completed
+                if access == READ_MAR:
+                    reads[mar] += 1
+                elif access == WRITE_MAR:
+                    writes[mar] += 1
+                elif access == READ_PAIR:
+                    reads[addr] += 1
+                elif access == WRITE_PAIR:
+                    writes[addr] += 1
+        finally:
+            self.cycles += cycles
+
+        if cycles >= max_cycles:
+            raise ValueError("Max cpu cycles exceeded")
+        return cycles
+
+    def hot_pcs(self, top=10):
+        #[(pc, count)] most executed first
+        counts = [(pc, count) for pc, count in enumerate(self.pc_counts) if count]
+        counts.sort(key=lambda item: -item[1])
+        return counts[:top]
+
+    def hot_opcodes(self, top=10):
+        counts = [(opcode, count) for opcode, count in enumerate(self.opcode_counts) if count]
+        counts.sort(key=lambda item: -item[1])
+        return counts[:top]
+
+    def hot_loops(self, top=10):
+        #a taken backward jump from end to start is a loop over [start, end],
+        #ranked by the instructions executed inside it
+        loops = []
+        for (pc, target), taken in self.edges.items():
+            if target is not None and target <= pc:
+                executed = sum(self.pc_counts[target:pc + 1])
+                loops.append((target, pc, taken, executed))
+        loops.sort(key=lambda item: -item[3])
+        return loops[:top]
+
+    def hot_data(self, top=10, range_size=256):
+        #[(start, reads, writes)] per range_size aligned range, most accessed first
+        ranges = []
+        for start in range(0, len(self.reads), range_size):
+            reads = sum(self.reads[start:start + range_size])
+            writes = sum(self.writes[start:start + range_size])
+            if reads or writes:
+                ranges.append((start, reads, writes))
+        ranges.sort(key=lambda item: -(item[1] + item[2]))
+        return ranges[:top]
+
+    def report(self, top=10, range_size=256):
+        total = self.cycles or 1
+        lines = [f"{self.cycles} instructions"]
+
+        lines.append("")
+        lines.append("hot opcodes:")
+        for opcode, count in self.hot_opcodes(top):
+            lines.append(f"  {opcode:02X} {opcode_name(opcode):<8} {count:>12} {count / total:7.2%}")
+
+        lines.append("")
+        lines.append("hot PCs:")
+        for pc, count in self.hot_pcs(top):
+            lines.append(f"  {pc:04X} {count:>12} {count / total:7.2%}")
+
+        lines.append("")
+        lines.append("hot loops:")
+        for start, end, taken, executed in self.hot_loops(top):
+            lines.append(f"  {start:04X}-{end:04X} {taken:>12} back jumps {executed:>12} instructions {executed / total:7.2%}")
+
+        lines.append("")
+        lines.append("branches (taken / not taken):")
+        for pc, (taken, not_taken) in sorted(self.branches.items(), key=lambda item: -sum(item[1]))[:top]:
+            lines.append(f"  {pc:04X} {taken:>12} {not_taken:>12}")
+
+        lines.append("")
+        lines.append("hot data (reads / writes):")
+        for start, reads, writes in self.hot_data(top, range_size):
+            lines.append(f"  {start:04X}-{start + range_size - 1:04X} {reads:>12} {writes:>12}")
+
+        return "\n".join(lines)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile a CPU8Bit program")
+    parser.add_argument("program", help=".asm program to run")
+    parser.add_argument("--max-cycles", type=int, default=100000)
+    parser.add_argument("--top", type=int, default=10, help="entries per table")
+    parser.add_argument("--range-size", type=int, default=256, help="bytes per hot data range")
+    args = parser.parse_args(argv)
+
+    cpu = CPU8Bit()
+    cpu.load_program(assemble(args.program))
+    profiler = Profiler(len(cpu.mem))
+    try:
+        cpu.run(args.max_cycles, profile=profiler)
+    except (ValueError, IndexError) as e:
+        print(f"stopped: {e}", file=sys.stderr)
+    print(profiler.report(args.top, args.range_size))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+'''
+Process pool runner for many programs and input sets.
+
+A job is a plain dict so it can come straight from a JSON lines file:
+
+    {
+        "id": "mul-8-6",                    #optional, echoed in the result
+        "program": "programs/multiply.asm", #.asm or .c8o object file path, or
+        "source": "LDI R0, #8\\nHLT",        #assembly text, or
+        "image": "10081106...",             #machine code as hex, loaded at 0
+        "registers": [0, 0, 0, 0],          #optional initial R0-R3
+        "memory": {"0x1000": "0102"},       #optional patches, address -> hex bytes or list of ints
+        "max_cycles": 100000,
+        "dump": [["0x1000", 16]]            #optional memory ranges to return
+    }
+
+Results are yielded as jobs complete, in completion order. A job that
+cannot run comes back as a result with an error instead, also a line of a
+.jsonl file that is not a JSON object, whose result has "path:line" as id.
+'''
+
+import os
+import sys
+
+from .asmcache import cached_assemble
+from .assembler import assemble_segments
+from .cpu import CPU8Bit
+from .objfile import load_object
+
+
+#assembled programs per worker process, keyed by path -> (mtime, segments, entry)
+image_cache = {}
+
+#directory of the shared on-disk assembly cache, None to always assemble
+asm_cache_dir = None
+
+
+def init_worker(cache_dir):
+    global asm_cache_dir
+    asm_cache_dir = cache_dir
+
+
+def parse_int(value):
+    if isinstance(value, str):
+        return int(value, 0)
+    return int(value)
+
+
+def parse_bytes(value):
+    if isinstance(value, str):
+        return bytes.fromhex(value)
+    return bytes(b & 0xFF for b in value)
+
+
+def load_image(job):
+    #returns (origin, bytes) segments and the entry point
+    if "image" in job:
+        return [(0, parse_bytes(job["image"]))], 0
+    if "source" in job:
+        return assemble_segments(job["source"])[0], 0
+    if "program" not in job:
+        raise ValueError("Job has no program, source or image")
+
+    path = job["program"]
+    mtime = os.stat(path).st_mtime_ns
+    cached = image_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        if path.endswith(".c8o"):
+            #segments are views of the mapped file, kept open for the worker's lifetime
+            obj = load_object(path)
+            cached = (mtime, obj.segments, obj.entry)
+            image_cache[path] = cached
+            return cached[1], cached[2]
+        if asm_cache_dir:
+            segments = [(0, bytes(cached_assemble(path, asm_cache_dir)[0]))]
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                segments = assemble_segments(f)[0]
+        cached = (mtime, segments, 0)
+        image_cache[path] = cached
+    return cached[1], cached[2]
+
+
+def run_job(job):
+    if not isinstance(job, dict):
+        return {"id": None, "error": f"Job is not an object: {job!r}"}
+    result = {"id": job.get("id"), "error": None}
+    if job.get("error"):
+        #a line read_jobs could not parse
+        result["error"] = job["error"]
+        return result
+
+    #everything taken from the job is checked here, so a bad job gives an
+    #error result instead of failing the worker
+    try:
+        max_cycles = parse_int(job.get("max_cycles", 100000))
+        segments, entry = load_image(job)
+        patches = [(parse_int(addr), parse_bytes(data)) for addr, data in job.get("memory", {}).items()]
+        registers = [parse_int(v) & 0xFF for v in job.get("registers", [0, 0, 0, 0])]
+        if len(registers) != 4:
+            raise ValueError(f"Job needs 4 registers, got {len(registers)}")
+        dumps = [(parse_int(start), parse_int(length)) for start, length in job.get("dump", [])]
+
+        cpu = CPU8Bit()
+        cpu.load_segments(segments)
+        cpu.PC = entry
+        for addr, data in patches:
+            cpu.load_program(data, addr)
+        cpu.reg = registers
+    except (OSError, ValueError, TypeError, AttributeError, NameError, IndexError, OverflowError, MemoryError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        return result
+
+    #run_blocks(), keeping the cycles run before an invalid instruction
+    try:
+        result["cycles"] = cpu.advance_blocks(max_cycles)
+        if result["cycles"] >= max_cycles:
+            result["error"] = "Max cpu cycles exceeded"
+    except (ValueError, IndexError) as e:
+        result["error"] = str(e)
+        result["cycles"] = e.cycles
+
+    result.update({
+        "reg": list(cpu.reg),
+        "IR": cpu.IR,
+        "Z": cpu.Z,
+        "C": cpu.C,
+        "PC": cpu.PC,
+        "MAR": cpu.MAR,
+        "halted": cpu.halted,
+        "memory": {
+            f"0x{start:04X}": cpu.view(start, start + length).hex()
+            for start, length in dumps
+        },
+    })
+    return result
+
+
+def run_jobs(jobs, workers=None, max_pending=None, asm_cache=None):
+    #run jobs on a process pool, yielding each result as soon as it is done.
+    #Imported here, the workers only need run_job
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(asm_cache,)) as pool:
+        pending = set()
+        for job in jobs:
+            pending.add(pool.submit(run_job, job))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def read_jobs(paths, max_cycles):
+    #.jsonl files hold one job per line, anything else is an .asm or .c8o path.
+    #A line that is not a job object gives a job with only an id and the
+    #error, which run_job returns as its result
+    import json
+
+    for path in paths:
+        if path.endswith(".jsonl"):
+            with open(path, "r", encoding="utf-8") as f:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        job = json.loads(line)
+                    except ValueError as e:
+                        yield {"id": f"{path}:{number}", "error": f"Bad JSON: {e}"}
+                        continue
+                    if not isinstance(job, dict):
+                        yield {"id": f"{path}:{number}", "error": f"Job is not an object: {line.strip()}"}
+                        continue
+                    job.setdefault("max_cycles", max_cycles)
+                    yield job
+        else:
+            yield {"id": path, "program": path, "max_cycles": max_cycles}
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Run CPU8Bit jobs across a process pool")
+    parser.add_argument("jobs", nargs="+", help=".asm programs, .c8o object files or .jsonl job files")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--max-cycles", type=int, default=100000, help="default cycle budget per job")
+    parser.add_argument("--asm-cache", default=os.environ.get("CPU8_ASM_CACHE"), help="on-disk assembly cache directory shared by the workers")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for result in run_jobs(read_jobs(args.jobs, args.max_cycles), args.workers, asm_cache=args.asm_cache):
+        if result["error"]:
+            failed += 1
+        sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+'''
+Cooperative asyncio scheduling of CPU8Bit machines.
+
+run_cpu() runs one CPU as a coroutine, yielding to the event loop after
+every quantum of instructions. Scheduler multiplexes any number of CPUs on
+one event loop from a single task, sharing cycles by priority:
+
+    scheduler = Scheduler(quantum=10000)
+    guest = scheduler.add(cpu, budget=1_000_000, priority=2)
+    await scheduler.run()       #or run it as a background task
+    guest.status                #"halted", "out_of_budget", "error", "cancelled"
+
+A guest that uses up its budget is paused, not failed: give it more cycles
+with guest.resume(cycles) and it carries on from the same instruction.
+Cancelling a guest, or the task awaiting run_cpu(), stops it between
+quanta, with the CPU left in a consistent state.
+'''
+
+import asyncio
+import heapq
+import itertools
+
+#instructions run between yields to the event loop
+DEFAULT_QUANTUM = 10000
+
+
+async def run_cpu(cpu, budget=None, quantum=DEFAULT_QUANTUM, fast_loops=True):
+    #runs cpu until HLT or until budget cycles have run, returns the cycles run.
+    #A used up budget just returns, call again to continue. Invalid
+    #instructions raise as they do from run().
+    cycles = 0
+    while not cpu.halted and (budget is None or cycles < budget):
+        n = quantum if budget is None else min(quantum, budget - cycles)
+        cycles += cpu.advance_blocks(n, fast_loops)
+        await asyncio.sleep(0)
+    return cycles
+
+
+class Guest:
+    #a CPU hosted by a Scheduler, create with Scheduler.add()
+    def __init__(self, scheduler, cpu, budget, priority, name):
+        if priority <= 0:
+            raise ValueError("Priority must be positive")
+        self.scheduler = scheduler
+        self.cpu = cpu
+        self.budget = budget        #cycles left, None for no limit
+        self.priority = priority    #share of cycles relative to the other guests
+        self.name = name
+        self.cycles = 0             #cycles run in total
+        self.error = None           #exception from an invalid instruction
+        self.cancelled = False
+
+        #virtual time for fair sharing, cycles run / priority
+        self.vtime = 0.0
+        self.queued = False
+        self.stopped = asyncio.Event()
+
+    @property
+    def status(self):
+        if self.error is not None:
+            return "error"
+        if self.cancelled:
+            return "cancelled"
+        if self.cpu.halted:
+            return "halted"
+        if self.budget == 0:
+            return "out_of_budget"
+        return "runnable"
+
+    def resume(self, cycles=None):
+        #adds cycles to the budget (None lifts the limit) and schedules the guest again
+        if self.error is not None or self.cpu.halted:
+            raise ValueError(f"Guest cannot be resumed, it is {self.status}")
+        self.budget = None if cycles is None else (self.budget or 0) + cycles
+        self.cancelled = False
+        self.scheduler.schedule(self)
+
+    def cancel(self):
+        #stops the guest before its next quantum, resume() continues it
+        if self.status == "runnable":
+            self.cancelled = True
+            self.stopped.set()
+
+    async def wait(self):
+        #waits until the guest stops running, returns its status
+        await self.stopped.wait()
+        return self.status
+
+    def run_quantum(self, quantum, fast_loops):
+        #returns the cycles run
+        n = quantum if self.budget is None else min(quantum, self.budget)
+        try:
+            executed = self.cpu.advance_blocks(n, fast_loops)
+        except (ValueError, IndexError) as e:
+            #charged for the instructions run before the failing one
+            self.error = e
+            executed = e.cycles
+        self.cycles += executed
+        if self.budget is not None:
+            self.budget -= executed
+        return executed
+
+
+class Scheduler:
+    def __init__(self, quantum=DEFAULT_QUANTUM, fast_loops=True):
+        self.quantum = quantum
+        self.fast_loops = fast_loops
+        self.guests = []
+
+        #(vtime, order, guest) of runnable guests, lowest virtual time runs next
+        self.queue = []
+        self.order = itertools.count()
+        self.clock = 0.0
+
+    def add(self, cpu, budget=None, priority=1, name=None):
+        guest = Guest(self, cpu, budget, priority, name)
+        self.guests.append(guest)
+        self.schedule(guest)
+        return guest
+
+    def remove(self, guest):
+        guest.cancel()
+        self.guests.remove(guest)
+
+    def schedule(self, guest):
+        #a guest that was away does not get to catch up on the cycles it missed
+        guest.vtime = max(guest.vtime, self.clock)
+        guest.stopped.clear()
+        if guest.status != "runnable":
+            guest.stopped.set()
+        elif not guest.queued:
+            guest.queued = True
+            heapq.heappush(self.queue, (guest.vtime, next(self.order), guest))
+
+    async def run(self):
+        #runs guests a quantum at a time until none is runnable, yielding to
+        #the event loop after every quantum. Guests added or resumed in the
+        #meantime are picked up.
+        queue = self.queue
+        while queue:
+            vtime, _, guest = heapq.heappop(queue)
+            guest.queued = False
+            if guest.status != "runnable":
+                #cancelled while queued
+                continue
+
+            self.clock = vtime
+            executed = guest.run_quantum(self.quantum, self.fast_loops)
+            guest.vtime = vtime + max(executed, 1) / guest.priority
+
+            if guest.status == "runnable":
+                guest.queued = True
+                heapq.heappush(queue, (guest.vtime, next(self.order), guest))
+            else:
+                guest.stopped.set()
+            await asyncio.sleep(0)
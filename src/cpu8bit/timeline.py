@@ -0,0 +1,143 @@
+'''
+Checkpointed execution of CPU8Bit for seeking and stepping backwards.
+
+Timeline runs a CPU while taking a CPU8Bit.snapshot() every `interval`
+cycles. Snapshots only copy the memory pages written since the one before,
+so a checkpoint costs the registers plus the dirty pages. seek(cycle)
+restores the nearest checkpoint at or before that cycle and re-executes
+forward from it, at most `interval` instructions, instead of replaying from
+the start:
+
+    timeline = Timeline(cpu, interval=100000)
+    timeline.run(1_000_000_000)
+    timeline.seek(123_456_789)      #cpu now holds the state after that many cycles
+    timeline.step_back()
+
+Seeking past the recorded cycles runs forward and records as run() does.
+Runs are deterministic, so replays from a checkpoint always give the same
+state. If the CPU state is changed directly the later checkpoints no longer
+match, start a new Timeline from there.
+
+When an instruction fails, run() raises its error and leaves the CPU in the
+state just before it, at timeline.end, which is also what seek(timeline.end)
+gives: the faulting instruction is never replayed.
+
+    cpu8 timeline program.asm --interval 1000 --at 0 500 1200
+'''
+
+import sys
+
+from .assembler import assemble
+from .cpu import CPU8Bit
+
+#cycles between checkpoints
+DEFAULT_INTERVAL = 100000
+
+
+class Timeline:
+    def __init__(self, cpu, interval=DEFAULT_INTERVAL, fast_loops=True):
+        if interval <= 0:
+            raise ValueError("Checkpoint interval must be positive")
+        self.cpu = cpu
+        self.interval = interval
+        self.fast_loops = fast_loops
+        self.cycle = 0          #cycles executed to reach the current CPU state
+        self.end = None         #cycle the program stopped at, by HLT or an invalid instruction
+        self.error = None       #exception of the invalid instruction
+
+        #checkpoints[i] is the state at cycle i * interval
+        self.checkpoints = [cpu.snapshot()]
+
+    def run(self, max_cycles=100000):
+        #CPU8Bit.run from the current cycle, same results and errors
+        start = self.cycle
+        self.forward(start + max_cycles)
+        cycles = self.cycle - start
+        if cycles >= max_cycles:
+            raise ValueError("Max cpu cycles exceeded")
+        return cycles
+
+    def seek(self, cycle):
+        #puts the CPU in its state after `cycle` cycles, returns the cycle
+        #reached, which is earlier if the program stopped before it
+        if cycle < 0:
+            raise ValueError("Cycle must not be negative")
+        if self.end is not None:
+            cycle = min(cycle, self.end)
+
+        index = min(cycle // self.interval, len(self.checkpoints) - 1)
+        if cycle < self.cycle or index * self.interval > self.cycle:
+            self.cpu.restore(self.checkpoints[index])
+            self.cycle = index * self.interval
+        self.forward(cycle)
+        return self.cycle
+
+    def step_back(self, count=1):
+        return self.seek(max(0, self.cycle - count))
+
+    def forward(self, target):
+        #runs up to target, taking the checkpoints not taken yet on the way
+        cpu = self.cpu
+        interval = self.interval
+        checkpoints = self.checkpoints
+        if self.end is not None:
+            target = min(target, self.end)
+
+        while self.cycle < target and not cpu.halted:
+            boundary = (self.cycle // interval + 1) * interval
+            start = self.cycle
+            try:
+                executed = cpu.advance_blocks(min(target, boundary) - start, self.fast_loops)
+            except (ValueError, IndexError) as e:
+                self.find_error(start, e)
+                raise
+            self.cycle += executed
+            if self.cycle == boundary and len(checkpoints) == boundary // interval:
+                checkpoints.append(cpu.snapshot())
+
+        if cpu.halted and self.end is None:
+            self.end = self.cycle
+
+    def find_error(self, start, error):
+        #error.cycles instructions ran from start before the failing one,
+        #replay up to it, so the CPU is left as seek(end) leaves it
+        cpu = self.cpu
+        index = start // self.interval
+        self.end = self.cycle = start + error.cycles
+        self.error = error
+        cpu.restore(self.checkpoints[index])
+        cpu.advance_blocks(self.end - index * self.interval, self.fast_loops)
+
+def format_state(cycle, cpu):
+    flags = f"Z={cpu.Z} C={cpu.C}"
+    regs = " ".join(f"R{i}={value:02X}" for i, value in enumerate(cpu.reg))
+    return f"{cycle:>12} PC={cpu.PC:04X} IR={cpu.IR:02X} MAR={cpu.MAR:04X} {regs} {flags}{' HALT' if cpu.halted else ''}"
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show CPU8Bit state at chosen cycles of a run")
+    parser.add_argument("program", help=".asm program to run")
+    parser.add_argument("--max-cycles", type=int, default=100000)
+    parser.add_argument("--interval", type=int, default=DEFAULT_INTERVAL, help="cycles between checkpoints")
+    parser.add_argument("--at", type=int, nargs="+", default=[], help="cycles to show the state at")
+    args = parser.parse_args(argv)
+
+    cpu = CPU8Bit()
+    cpu.load_program(assemble(args.program))
+    timeline = Timeline(cpu, args.interval)
+    try:
+        timeline.run(args.max_cycles)
+    except (ValueError, IndexError) as e:
+        print(f"stopped: {e}", file=sys.stderr)
+    print(format_state(timeline.cycle, cpu))
+
+    for cycle in args.at:
+        reached = timeline.seek(cycle)
+        print(format_state(reached, cpu))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
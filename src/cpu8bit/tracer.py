@@ -0,0 +1,212 @@
+'''
+Binary execution tracer for CPU8Bit.
+
+Tracer.run is a copy of the CPU8Bit.run loop that packs one fixed-size
+record per executed instruction into a preallocated buffer:
+
+    u16 PC | u8 IR | u8 R0 | u8 R1 | u8 R2 | u8 R3 | u8 flags (Z | C << 1) | u16 MAR
+
+PC and IR are the address and opcode of the instruction, the registers,
+flags and MAR are the state after it executed. An instruction that raises
+still gets its record.
+
+Without a file the buffer is a ring that keeps the last `capacity` records.
+With a file the buffer is flushed to it whenever it fills, so the whole run
+is kept. Trace files start with a header:
+
+    magic "C8TR" | u16 format | u16 record size | u64 cycle of the first record
+
+Records are only turned into tuples / text when they are read back, with
+Tracer.records() or read_trace(), optionally filtered by PC range or cycle
+window.
+
+    tracer = Tracer(file=open("run.c8t", "wb"))
+    cpu.run(max_cycles, trace=tracer)
+    tracer.close()
+
+    cpu8 trace run.c8t --pc 0x0010:0x0020 --cycles 1000:2000
+'''
+
+import struct
+import sys
+
+MAGIC = b"C8TR"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<4sHHQ")
+RECORD = struct.Struct("<HB4BBH")
+RECORD_SIZE = RECORD.size
+
+#records read per chunk from a trace file
+READ_CHUNK = 65536
+
+
+class Tracer:
+    def __init__(self, capacity=65536, file=None):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD_SIZE)
+        self.file = file
+        self.count = 0          #records written so far
+        self.pos = 0            #next record slot in the buffer
+        self.wrapped = False    #ring mode, the buffer has been overwritten at least once
+
+        if file is not None:
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD_SIZE, 0))
+
+    def run(self, cpu, max_cycles=100000):
+        #CPU8Bit.run with a record per instruction, same results and errors
+        cache = cpu.decode_cache
+        decode = cpu.decode
+        pack = RECORD.pack_into
+        buffer = self.buffer
+        end = len(buffer)
+        offset = self.pos * RECORD_SIZE
+
+        cycles = 0
+        written = 0
+        try:
+            while not cpu.halted and cycles < max_cycles:
+                pc = cpu.PC & 0xFFFF
+                entry = cache.get(pc)
+                if entry is None:
+                    entry = decode(pc)
+                handler, opcode, next_pc, mar, x, y, z = entry
+                cpu.IR = opcode
+                cpu.PC = next_pc
+                if mar is not None:
+                    cpu.MAR = mar
+                try:
+                    handler(x, y, z)
+                finally:
+                    reg = cpu.reg
+                    pack(buffer, offset, pc, opcode, reg[0], reg[1], reg[2], reg[3], (0 if cpu.z_result else 1) | (cpu.c_result >> 7 & 2), cpu.MAR)
+                    written += 1
+                    offset += RECORD_SIZE
+                    if offset == end:
+                        self.wrap()
+                        offset = 0
+                cycles += 1
+        finally:
+            self.count += written
+            self.pos = offset // RECORD_SIZE
+
+        if cycles >= max_cycles:
+            raise ValueError("Max cpu cycles exceeded")
+        return cycles
+
+    def wrap(self):
+        #the buffer is full: write it out, or start overwriting the oldest records
+        if self.file is not None:
+            self.file.write(self.buffer)
+        else:
+            self.wrapped = True
+
+    def flush(self):
+        #file mode, write the records still in the buffer
+        if self.file is not None and self.pos:
+            self.file.write(memoryview(self.buffer)[:self.pos * RECORD_SIZE])
+            self.pos = 0
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+
+    def retained(self):
+        #ring mode, (cycle of the first record, record bytes oldest first)
+        if self.file is not None:
+            raise ValueError("Records of a file trace are read back with read_trace()")
+        split = self.pos * RECORD_SIZE
+        if self.wrapped:
+            data = bytes(self.buffer[split:]) + bytes(self.buffer[:split])
+        else:
+            data = bytes(self.buffer[:split])
+        return self.count - len(data) // RECORD_SIZE, data
+
+    def records(self, pc_range=None, cycles=None):
+        first_cycle, data = self.retained()
+        return iter_records(data, first_cycle, pc_range, cycles)
+
+    def save(self, path):
+        #ring mode, write the retained records as a trace file
+        first_cycle, data = self.retained()
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD_SIZE, first_cycle))
+            f.write(data)
+
+
+def iter_records(data, first_cycle=0, pc_range=None, cycles=None):
+    #yields (cycle, PC, IR, R0, R1, R2, R3, Z, C, MAR) for records in data,
+    #pc_range and cycles are (start, end) with end excluded
+    view = memoryview(data)
+    count = len(view) // RECORD_SIZE
+    lo, hi = 0, count
+    if cycles is not None:
+        lo = min(max(cycles[0] - first_cycle, 0), count)
+        hi = min(max(cycles[1] - first_cycle, lo), count)
+
+    cycle = first_cycle + lo
+    for pc, ir, r0, r1, r2, r3, flags, mar in RECORD.iter_unpack(view[lo * RECORD_SIZE:hi * RECORD_SIZE]):
+        if pc_range is None or pc_range[0] <= pc < pc_range[1]:
+            yield (cycle, pc, ir, r0, r1, r2, r3, flags & 1, flags >> 1, mar)
+        cycle += 1
+
+
+def read_trace(path, pc_range=None, cycles=None):
+    #lazily yields the records of a trace file, seeking straight to the cycle window
+    with open(path, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError("Not a trace file")
+        magic, version, record_size, first_cycle = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("Not a trace file")
+        if version != FORMAT_VERSION or record_size != RECORD_SIZE:
+            raise ValueError(f"Unsupported trace format {version}")
+
+        cycle, stop = first_cycle, None
+        if cycles is not None:
+            cycle = max(cycles[0], first_cycle)
+            stop = cycles[1]
+            f.seek(HEADER.size + (cycle - first_cycle) * RECORD_SIZE)
+
+        while stop is None or cycle < stop:
+            want = READ_CHUNK if stop is None else min(READ_CHUNK, stop - cycle)
+            data = f.read(want * RECORD_SIZE)
+            if len(data) < RECORD_SIZE:
+                break
+            yield from iter_records(data, cycle, pc_range)
+            cycle += len(data) // RECORD_SIZE
+
+
+def format_record(record):
+    cycle, pc, ir, r0, r1, r2, r3, z, c, mar = record
+    return f"{cycle:>10} PC={pc:04X} IR={ir:02X} R0={r0:02X} R1={r1:02X} R2={r2:02X} R3={r3:02X} Z={z} C={c} MAR={mar:04X}"
+
+
+def parse_range(text):
+    #"start:end", either side may be left out
+    start, _, end = text.partition(":")
+    return (int(start, 0) if start else 0, int(end, 0) if end else 1 << 64)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print a CPU8Bit trace file")
+    parser.add_argument("trace", help="trace file written by Tracer")
+    parser.add_argument("--pc", type=parse_range, help="PC range start:end, end excluded")
+    parser.add_argument("--cycles", type=parse_range, help="cycle window start:end, end excluded")
+    args = parser.parse_args(argv)
+
+    try:
+        for record in read_trace(args.trace, args.pc, args.cycles):
+            sys.stdout.write(format_record(record) + "\n")
+    except BrokenPipeError:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import os
+
+from cpu8bit.asmcache import cached_assemble, write_atomic
+from cpu8bit.assembler import assemble_program
+
+
+def test_cached_assemble(tmp_path):
+    program = tmp_path / "prog.asm"
+    program.write_text("start:\nLDI R0, #7\nHLT\n")
+    cache = tmp_path / "cache"
+
+    expected, labels = assemble_program(str(program))
+    first = cached_assemble(str(program), str(cache))
+    assert len(os.listdir(cache)) == 1
+    second = cached_assemble(str(program), str(cache))
+    assert first == second == (expected, {"start": 0})
+
+    #an edited source gets a new entry
+    program.write_text("start:\nLDI R0, #8\nHLT\n")
+    machine_code, labels = cached_assemble(str(program), str(cache))
+    assert machine_code[1] == 8
+    assert len(os.listdir(cache)) == 2
+
+
+def test_damaged_entry_is_rebuilt(tmp_path):
+    program = tmp_path / "prog.asm"
+    program.write_text("LDI R0, #7\nHLT\n")
+    cache = tmp_path / "cache"
+    cached_assemble(str(program), str(cache))
+    (entry,) = cache.iterdir()
+    entry.write_bytes(b"junk")
+    machine_code, labels = cached_assemble(str(program), str(cache))
+    assert machine_code[:3] == bytes([0x10, 7, 0xFF])
+
+
+def test_write_atomic_bare_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_atomic("out.bin", b"data")
+    assert (tmp_path / "out.bin").read_bytes() == b"data"
+    assert os.listdir(tmp_path) == ["out.bin"]
@@ -0,0 +1,96 @@
+import pytest
+
+from cpu8bit.assembler import HashTable, assemble_segments, build_image, tokenize
+
+
+def test_encodings():
+    source = """
+NOP
+LDI R1, #0x12
+LD R2, [0x1234]
+ST R3, [0x0010]
+ADD R0, #1
+ADD R0, R3
+SUB R1, #2
+AND R1, #0x0F
+OR R1, #0xF0
+XOR R1, #0xFF
+MOV R2, R1
+LDX R0, [R1:R2]
+STX R3, [R2:R1]
+HLT
+"""
+    segments, labels = assemble_segments(source)
+    assert segments == [(0, bytes([
+        0x00,
+        0x11, 0x12,
+        0x22, 0x34, 0x12,
+        0x33, 0x10, 0x00,
+        0x40, 0x01,
+        0x50, 0x03,
+        0x61, 0x02,
+        0x71, 0x0F,
+        0x81, 0xF0,
+        0x91, 0xFF,
+        0xB2, 0x01,
+        0xC0, 0x12,
+        0xD3, 0x21,
+        0xFF,
+    ]))]
+
+
+def test_labels_and_forward_references():
+    source = """
+start:
+JMP end
+LD R0, [data+1]
+end:
+JZ start
+HLT
+data:
+.BYTE 1, 2
+.WORD end
+"""
+    segments, labels = assemble_segments(source)
+    assert dict(labels.items()) == {"start": 0, "end": 6, "data": 10}
+    assert segments[0][1][:9] == bytes([0xA0, 6, 0, 0x20, 11, 0, 0xA1, 0, 0])
+    assert segments[0][1][10:] == bytes([1, 2, 6, 0])
+
+
+def test_org_segments():
+    segments, labels = assemble_segments("LDI R0, #1\n.org 0x0100\nHLT\n.org 0x0000\nNOP\n")
+    assert segments == [(0, bytes([0x10, 1])), (0x100, bytes([0xFF])), (0, bytes([0x00]))]
+    image = build_image(segments)
+    assert image[0:2] == bytes([0x00, 1])
+    assert image[0x100] == 0xFF
+
+
+def test_tokenize():
+    assert tokenize("  ld r0, [0x10] ; comment\n") == ["ld", "r0", "[0x10]"]
+    assert tokenize("; only a comment") == []
+
+
+@pytest.mark.parametrize("source, message", [
+    ("LDI R4, #1", "Register out of range"),
+    ("LDI X0, #1", "Bad register"),
+    ("LDI R0, #zz", "Bad immediate"),
+    ("LD R0, 0x10", "brackets"),
+    ("JMP [0x10]", "should not be in"),
+    ("JMP nowhere", "Unknown label"),
+    ("FOO R0", "Unknown mnemonic"),
+    ("a:\na:", "Duplicate label"),
+    ("LDI R0", "Bad LDI syntax"),
+])
+def test_errors(source, message):
+    with pytest.raises(ValueError, match=message):
+        assemble_segments(source)
+
+
+def test_hash_table_grows():
+    table = HashTable(2)
+    for i in range(100):
+        table.add(f"label{i}", i)
+    assert table.size >= 200
+    assert all(table.lookup(f"label{i}") == i for i in range(100))
+    with pytest.raises(NameError):
+        table.lookup("missing")
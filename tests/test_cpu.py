@@ -0,0 +1,94 @@
+import pytest
+
+from cpu8bit.assembler import assemble_segments, build_image
+from cpu8bit.cpu import CPU8Bit, Image
+
+#stores R0 at 0x1000, adds 1, stores it again
+PROGRAM = "LDI R0, #7\nST R0, [0x1000]\nADD R0, #1\nST R0, [0x1001]\nHLT\n"
+
+
+def image():
+    segments, labels = assemble_segments(PROGRAM)
+    return build_image(segments)
+
+
+def test_park_keeps_own_memory():
+    cpu = CPU8Bit()
+    cpu.load_program(image())
+    cpu.advance(2)
+    cpu.park()
+    assert cpu.parked
+    cpu.run()
+    assert cpu.mem[0x1000:0x1002] == bytes([7, 8])
+
+
+def test_park_keeps_adopted_buffer():
+    buffer = image()
+    cpu = CPU8Bit(memory=buffer)
+    cpu.advance(2)
+    assert buffer[0x1000] == 7
+    cpu.park()
+    cpu.unpark()
+    assert cpu.mem is buffer
+    cpu.park()
+    cpu.run()
+    assert cpu.mem is buffer
+    assert buffer[0x1001] == 8
+
+
+def test_park_keeps_attached_buffer():
+    buffer = image()
+    cpu = CPU8Bit()
+    cpu.load_program(buffer, copy=False)
+    cpu.park()
+    #written by the owner while parked
+    buffer[0x2000] = 0x55
+    cpu.run()
+    assert cpu.mem is buffer
+    assert cpu.mem[0x2000] == 0x55
+    assert buffer[0x1000:0x1002] == bytes([7, 8])
+
+
+def test_attach_memory_on_parked_cpu():
+    buffer = image()
+    cpu = CPU8Bit(image=Image(bytes(65536)))
+    cpu.attach_memory(buffer)
+    assert not cpu.parked
+    assert cpu.mem is buffer
+    cpu.run()
+    assert buffer[0x1001] == 8
+
+
+def test_parked_on_shared_image():
+    shared = Image(image())
+    cpus = [CPU8Bit(image=shared) for _ in range(3)]
+    cpus[0].run()
+    assert cpus[0].mem[0x1000] == 7
+    assert cpus[1].parked
+    cpus[0].park()
+    assert cpus[0].overlay is not None and list(cpus[0].overlay) == [0x10]
+    assert cpus[0].mem[0x1001] == 8
+
+
+def test_snapshot_restore():
+    cpu = CPU8Bit()
+    cpu.load_program(image())
+    start = cpu.snapshot()
+    cpu.run()
+    cpu.restore(start)
+    assert cpu.PC == 0 and not cpu.halted
+    assert cpu.mem[0x1000] == 0
+    cpu.run()
+    assert cpu.mem[0x1000] == 7
+
+
+def test_view_is_read_only():
+    cpu = CPU8Bit()
+    cpu.load_program(image())
+    view = cpu.view(0x1000, 0x1002)
+    assert view.readonly
+    with pytest.raises(TypeError):
+        view[0] = 1
+    cpu.run()
+    #a live view, not a copy
+    assert bytes(view) == bytes([7, 8])
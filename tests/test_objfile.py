@@ -0,0 +1,49 @@
+from cpu8bit.assembler import assemble_segments
+from cpu8bit.cpu import CPU8Bit
+from cpu8bit.objfile import encode_object, load_object, main, parse_entry
+
+SOURCE = """
+LDI R0, #3
+loop:
+SUB R0, #1
+JNZ loop
+HLT
+.org 0x0100
+data:
+.BYTE 1, 2, 3
+"""
+
+
+def test_round_trip(tmp_path):
+    segments, labels = assemble_segments(SOURCE)
+    labels = dict(labels.items())
+    path = tmp_path / "prog.c8o"
+    path.write_bytes(encode_object(segments, labels, entry=labels["loop"]))
+
+    with load_object(str(path)) as obj:
+        assert [(origin, bytes(data)) for origin, data in obj.segments] == segments
+        assert obj.labels == labels
+        assert obj.entry == 2
+        cpu = CPU8Bit()
+        obj.load(cpu)
+    assert cpu.PC == 2
+    assert cpu.mem[0x0100:0x0103] == bytes([1, 2, 3])
+
+
+def test_main_writes_next_to_the_program(tmp_path, monkeypatch):
+    #no directory part in either path
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "prog.asm").write_text(SOURCE)
+    assert main(["prog.asm"]) == 0
+    assert main(["prog.asm", "-o", "out.c8o", "--entry", "loop"]) == 0
+
+    with load_object("prog.c8o") as obj:
+        assert obj.entry == 0
+    with load_object("out.c8o") as obj:
+        assert obj.entry == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out.c8o", "prog.asm", "prog.c8o"]
+
+
+def test_parse_entry():
+    assert parse_entry("loop", {"loop": 2}) == 2
+    assert parse_entry("0x10", {}) == 0x10
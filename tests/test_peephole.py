@@ -0,0 +1,132 @@
+from cpu8bit.assembler import assemble_segments, build_image
+from cpu8bit.cpu import CPU8Bit
+
+
+def run(source, optimize):
+    #final state and error of source, assembled with or without the peephole pass
+    segments, labels = assemble_segments(source, optimize=optimize)
+    cpu = CPU8Bit()
+    cpu.load_program(build_image(segments))
+    try:
+        cpu.run()
+        error = None
+    except ValueError as e:
+        error = str(e)
+    return error, cpu.reg, cpu.PC, cpu.MAR, bytes(cpu.mem)
+
+
+def assert_same(source):
+    assert run(source, True) == run(source, False)
+
+
+def assert_same_registers(source):
+    #for code that shrinks, which moves PC and the code in memory
+    assert run(source, True)[:2] == run(source, False)[:2]
+
+
+def test_removes_nops():
+    segments, labels = assemble_segments("NOP\nLDI R0, #1\nNOP\nHLT\n", optimize=True)
+    assert segments == [(0, bytes([0x10, 0x01, 0xFF]))]
+
+
+def test_store_into_labelled_code():
+    assert_same("""
+LDI R0, #9
+ST R0, [tgt]
+NOP
+tgt:
+NOP
+HLT
+""")
+
+
+def test_load_from_labelled_code():
+    assert_same("""
+NOP
+LD R1, [tgt]
+HLT
+tgt:
+NOP
+.BYTE 0x12
+""")
+
+
+def test_word_of_labelled_code():
+    #the pointer is read with LDX, the code behind it must stay put
+    assert_same("""
+LD R2, [ptr]
+LDI R3, #0
+LDX R1, [R3:R2]
+HLT
+ptr:
+.WORD tgt
+NOP
+tgt:
+MOV R0, R0
+LDI R0, #0x77
+""")
+
+
+def test_load_from_data_still_optimized():
+    source = """
+NOP
+LD R1, [value]
+HLT
+value:
+.BYTE 0x12
+"""
+    assert_same_registers(source)
+    segments, labels = assemble_segments(source, optimize=True)
+    assert len(segments[0][1]) == 5
+
+
+def test_redundant_load_keeps_mar():
+    assert_same("LD R0, [0x1234]\nLDI R0, #5\nHLT\n")
+
+
+def test_redundant_load_removed_when_mar_is_overwritten():
+    source = "LD R0, [0x1234]\nLDI R0, #5\nST R0, [0x2000]\nHLT\n"
+    assert_same_registers(source)
+    assert run(source, True)[3] == run(source, False)[3]
+    segments, labels = assemble_segments(source, optimize=True)
+    assert segments[0][1][0] == 0x10
+
+
+def test_rewrites_keep_results():
+    source = """
+LDI R0, #0
+ADD R0, R1
+LDI R2, #0
+ADD R2, #5
+MOV R3, R3
+LDI R3, #9
+loop:
+SUB R2, #1
+JZ out
+JMP hop
+hop:
+JMP loop
+out:
+ST R2, [0x1000]
+ST R2, [0x1000]
+LD R1, [0x1000]
+HLT
+"""
+    report = []
+    segments, labels = assemble_segments(source, optimize=True, report=report)
+    assert len(segments[0][1]) < len(assemble_segments(source)[0][0][1])
+    assert any(after == "MOV R0, R1" for number, before, after in report)
+    assert any(after == "LDI R2, #5" for number, before, after in report)
+    assert any(after == "JMP loop" for number, before, after in report)
+    assert_same_registers(source)
+
+
+def test_frozen_numeric_target():
+    #the JMP into the middle of the code pins every byte of the run
+    assert_same("""
+JMP 0x0004
+NOP
+NOP
+LDI R0, #1
+HLT
+""")
@@ -0,0 +1,86 @@
+import json
+
+from cpu8bit.runner import read_jobs, run_job, run_jobs
+
+PROGRAM = "LDI R0, #3\nloop:\nADD R1, #2\nSUB R0, #1\nJNZ loop\nHLT\n"
+
+
+def test_run_source_job():
+    result = run_job({"id": "a", "source": PROGRAM, "dump": [["0", 2]]})
+    assert result["error"] is None
+    assert result["cycles"] == 11
+    assert result["reg"] == [0, 6, 0, 0]
+    assert result["halted"]
+    assert result["memory"] == {"0x0000": "1003"}
+
+
+def test_registers_memory_and_image():
+    #LD R0, [0x1000] / ADD R0, R1 / HLT
+    job = {"image": "2000105001ff", "registers": [0, 5, 0, 0], "memory": {"0x1000": [7]}}
+    result = run_job(job)
+    assert result["error"] is None
+    assert result["reg"] == [12, 5, 0, 0]
+
+
+def test_program_file(tmp_path):
+    path = tmp_path / "prog.asm"
+    path.write_text(PROGRAM)
+    result = run_job({"id": str(path), "program": str(path)})
+    assert result["reg"][1] == 6
+
+
+def test_bad_jobs_are_error_results():
+    for job, error in [
+        ({}, "ValueError: Job has no program, source or image"),
+        ({"image": "zz"}, "ValueError"),
+        ({"source": "LDI R9, #1"}, "ValueError"),
+        ({"source": PROGRAM, "registers": [1, 2]}, "ValueError: Job needs 4 registers, got 2"),
+        ({"source": PROGRAM, "memory": {"0x1000": "xyz"}}, "ValueError"),
+        ({"source": PROGRAM, "dump": [["0x10"]]}, "ValueError"),
+        ({"source": PROGRAM, "max_cycles": "lots"}, "ValueError"),
+        ({"program": "/no/such/file.asm"}, "FileNotFoundError"),
+        ([1, 2], "Job is not an object"),
+    ]:
+        result = run_job(job)
+        assert result["error"].startswith(error), (job, result)
+
+
+def test_failed_run_reports_cycles():
+    result = run_job({"source": "LDI R0, #1\nLDI R1, #2\n.BYTE 0xE0\n"})
+    assert result["error"] == "Unknown opcode E0"
+    assert result["cycles"] == 2
+
+    result = run_job({"source": "loop:\nJMP loop\n", "max_cycles": 50})
+    assert result["error"] == "Max cpu cycles exceeded"
+    assert result["cycles"] == 50
+
+
+def test_read_jobs_keeps_going_past_bad_lines(tmp_path):
+    path = tmp_path / "jobs.jsonl"
+    lines = [
+        json.dumps({"id": "ok", "source": PROGRAM}),
+        "{not json",
+        "[1, 2]",
+        '"x"',
+        "",
+        json.dumps({"id": "ok2", "source": PROGRAM, "max_cycles": 5}),
+    ]
+    path.write_text("\n".join(lines) + "\n")
+    jobs = list(read_jobs([str(path)], 1000))
+    assert len(jobs) == 5
+    assert jobs[0]["max_cycles"] == 1000
+    assert jobs[4]["max_cycles"] == 5
+
+    results = {result["id"]: result for result in map(run_job, jobs)}
+    assert results["ok"]["error"] is None
+    assert results["ok2"]["error"] == "Max cpu cycles exceeded"
+    assert results[f"{path}:2"]["error"].startswith("Bad JSON")
+    assert results[f"{path}:3"]["error"] == "Job is not an object: [1, 2]"
+    assert results[f"{path}:4"]["error"] == 'Job is not an object: "x"'
+
+
+def test_run_jobs_pool():
+    jobs = [{"id": i, "source": f"LDI R0, #{i}\nHLT\n"} for i in range(6)] + [{"id": "bad"}]
+    results = {result["id"]: result for result in run_jobs(jobs, workers=2)}
+    assert [results[i]["reg"][0] for i in range(6)] == list(range(6))
+    assert results["bad"]["error"].startswith("ValueError")
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from cpu8bit.assembler import assemble_segments, build_image
+from cpu8bit.cpu import CPU8Bit
+from cpu8bit.scheduler import Scheduler, run_cpu
+
+#11 instructions, then an invalid one
+FAULTING = """
+LDI R0, #5
+loop:
+SUB R0, #1
+JNZ loop
+.BYTE 0xE0
+"""
+
+#1 + 3 * 100 + 1 instructions
+COUNTING = """
+LDI R0, #100
+loop:
+ADD R1, #1
+SUB R0, #1
+JNZ loop
+HLT
+"""
+
+
+def cpu_for(source):
+    segments, labels = assemble_segments(source)
+    cpu = CPU8Bit()
+    cpu.load_program(build_image(segments))
+    return cpu
+
+
+@pytest.mark.parametrize("fast_loops", [True, False])
+def test_advance_reports_cycles_before_an_error(fast_loops):
+    cpu = cpu_for(FAULTING)
+    with pytest.raises(ValueError) as info:
+        cpu.advance_blocks(1000, fast_loops)
+    assert info.value.cycles == 11
+
+    cpu = cpu_for(FAULTING)
+    with pytest.raises(ValueError) as info:
+        cpu.advance(1000)
+    assert info.value.cycles == 11
+
+
+def test_failing_guest_is_charged_what_it_ran():
+    scheduler = Scheduler(quantum=1000)
+    guest = scheduler.add(cpu_for(FAULTING), budget=5000)
+    asyncio.run(scheduler.run())
+    assert guest.status == "error"
+    assert str(guest.error) == "Unknown opcode E0"
+    assert guest.cycles == 11
+    assert guest.budget == 5000 - 11
+
+
+def test_budget_and_resume():
+    scheduler = Scheduler(quantum=50)
+    guest = scheduler.add(cpu_for(COUNTING), budget=120)
+
+    async def main():
+        await scheduler.run()
+        assert guest.status == "out_of_budget"
+        assert guest.cycles == 120
+        guest.resume()
+        await scheduler.run()
+
+    asyncio.run(main())
+    assert guest.status == "halted"
+    assert guest.cycles == 302
+    assert guest.cpu.reg[1] == 100
+
+
+def test_priorities_share_cycles():
+    scheduler = Scheduler(quantum=10)
+    low = scheduler.add(cpu_for(COUNTING), priority=1)
+    high = scheduler.add(cpu_for(COUNTING), priority=3)
+
+    async def main():
+        task = asyncio.ensure_future(scheduler.run())
+        while not high.cpu.halted:
+            await asyncio.sleep(0)
+        #high ran about three times as many cycles as low by then
+        assert 2 * low.cycles < high.cycles < 4 * low.cycles + 10
+        await task
+
+    asyncio.run(main())
+    assert low.status == high.status == "halted"
+
+
+def test_run_cpu():
+    cpu = cpu_for(COUNTING)
+    assert asyncio.run(run_cpu(cpu, budget=100, quantum=30)) == 100
+    assert asyncio.run(run_cpu(cpu, quantum=30)) == 202
+    assert cpu.halted
@@ -0,0 +1,80 @@
+import pytest
+
+from cpu8bit.assembler import assemble_segments, build_image
+from cpu8bit.cpu import CPU8Bit
+from cpu8bit.timeline import Timeline
+
+#counts R0 down from 5, then runs into an invalid register pair
+FAULTING = """
+LDI R0, #5
+loop:
+SUB R0, #1
+JNZ loop
+.BYTE 0xE0
+"""
+
+COUNTING = """
+LDI R0, #200
+loop:
+ADD R1, #1
+SUB R0, #1
+JNZ loop
+HLT
+"""
+
+
+def cpu_for(source):
+    segments, labels = assemble_segments(source)
+    cpu = CPU8Bit()
+    cpu.load_program(build_image(segments))
+    return cpu
+
+
+def state(cpu):
+    return list(cpu.reg), cpu.Z, cpu.C, cpu.PC, cpu.MAR, cpu.IR, cpu.halted
+
+
+def states(source, cycles):
+    #state after each number of cycles, by stepping
+    cpu = cpu_for(source)
+    out = [state(cpu)]
+    for _ in range(cycles):
+        cpu.step()
+        out.append(state(cpu))
+    return out
+
+
+def test_seek_matches_stepping():
+    expected = states(COUNTING, 602)
+    timeline = Timeline(cpu_for(COUNTING), interval=64)
+    assert timeline.run() == 602
+    assert timeline.end == 602
+    for cycle in (0, 1, 63, 64, 65, 300, 601, 602, 10, 0, 602):
+        assert timeline.seek(cycle) == cycle
+        assert state(timeline.cpu) == expected[cycle]
+    assert timeline.step_back(5) == 597
+    assert state(timeline.cpu) == expected[597]
+
+
+def test_seek_past_the_recorded_cycles():
+    expected = states(COUNTING, 602)
+    timeline = Timeline(cpu_for(COUNTING), interval=64)
+    assert timeline.seek(400) == 400
+    assert state(timeline.cpu) == expected[400]
+    assert timeline.seek(10_000) == 602
+    assert state(timeline.cpu) == expected[602]
+
+
+def test_fault_leaves_the_state_before_it():
+    expected = states(FAULTING, 11)
+    timeline = Timeline(cpu_for(FAULTING), interval=4)
+    with pytest.raises(ValueError, match="Unknown opcode E0"):
+        timeline.run()
+    assert timeline.end == timeline.cycle == 11
+    after_run = state(timeline.cpu)
+    assert after_run == expected[11]
+    assert not timeline.cpu.halted
+
+    timeline.seek(0)
+    assert timeline.seek(timeline.end) == 11
+    assert state(timeline.cpu) == after_run